@@ -0,0 +1,222 @@
+"""
+ 批量检查
+ 对目录/通配符匹配到的所有源文件做词法分析或语法检查
+ 文件分批分发到进程池 工作进程启动时加载一次文法 各批完成后立即输出其中每个文件的结果 最后输出汇总
+ Implemented By Python
+"""
+
+import os
+import sys
+import glob
+import json
+import argparse
+from time import perf_counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from Syntaxer import Syntaxer, TRACE_OFF, ENGINES, ENGINE_FAST, ENGINE_GENERATED
+from Lexer import BACKENDS
+import ParserGenerator
+
+CONFIG_PATH = 'config/simple_c_grammar.xml'
+MODES = ('lex', 'syntax')
+# 每批最多的文件数 批越小结果输出越及时 批越大进程间通信越少
+MAX_BATCH = 16
+
+STATUS_PASS = 'pass'  # 通过
+STATUS_FAIL = 'fail'  # 语法不匹配
+STATUS_ERROR = 'error'  # 无法读取/词法错误/未知符号
+
+# 工作进程中的分析器 由init_worker创建
+worker = {}
+
+
+def init_worker(config_path, mode, engine, backend='regex'):
+    """
+    工作进程初始化 加载文法(及生成的语法分析模块) 之后每个文件不再初始化
+    """
+    syntaxer = Syntaxer(config_path=config_path, trace=TRACE_OFF, engine=engine)
+    syntaxer.lexer.backend = backend
+    syntaxer.load_grammar()
+    worker['syntaxer'] = syntaxer
+    worker['mode'] = mode
+    worker['engine'] = engine
+    if mode == 'syntax' and engine == ENGINE_GENERATED:
+        ParserGenerator.load_parser(syntaxer)
+
+
+def check_source(code_raw):
+    """
+    检查一段代码
+    :return: (状态, token数, 说明)
+    """
+    syntaxer = worker['syntaxer']
+    if worker['mode'] == 'lex':
+        return STATUS_PASS, len(syntaxer.lexer.tokenize(code_raw)), ''
+    ctx = syntaxer.analyze(code_raw, TRACE_OFF, worker['engine'])
+    if ctx.is_match:
+        return STATUS_PASS, ctx.n_tokens, ''
+    return STATUS_FAIL, ctx.n_tokens, '在第%d个token处匹配失败' % (ctx.summary['matches'] + 1)
+
+
+def check_file(path):
+    """
+    :return: dict 单个文件的结果
+    """
+    start = perf_counter()
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            code_raw = f.read()
+        status, n_tokens, msg = check_source(code_raw)
+    except Exception as e:
+        status, n_tokens, msg = STATUS_ERROR, 0, str(e)
+    return {'path': path, 'status': status, 'tokens': n_tokens, 'ms': (perf_counter() - start) * 1000, 'msg': msg}
+
+
+def check_batch(paths):
+    """
+    在工作进程中检查一批文件
+    :return: list
+    """
+    return [check_file(path) for path in paths]
+
+
+def collect_files(patterns, exts=('.c',)):
+    """
+    展开命令行给出的文件/目录/通配符 目录递归查找指定扩展名的文件
+    :param patterns: 路径列表
+    :param exts: 目录中要检查的扩展名
+    :return: list 去重并排序后的文件路径
+    """
+    files = set()
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            matched = glob.glob(pattern, recursive=True)
+        else:
+            matched = [pattern]
+        for path in matched:
+            if os.path.isdir(path):
+                for root, dirs, names in os.walk(path):
+                    dirs.sort()
+                    for name in names:
+                        if os.path.splitext(name)[1] in exts:
+                            files.add(os.path.join(root, name))
+            elif os.path.isfile(path):
+                files.add(path)
+            else:
+                raise Exception('文件%s不存在' % path)
+    return sorted(files)
+
+
+def split_batches(files, jobs):
+    """
+    每个进程约分到8批 批大小不超过MAX_BATCH
+    """
+    size = max(1, min(MAX_BATCH, len(files) // (jobs * 8)))
+    return [files[i:i + size] for i in range(0, len(files), size)]
+
+
+def iter_results(files, jobs=None, config_path=CONFIG_PATH, mode='syntax', engine=ENGINE_FAST, backend='regex'):
+    """
+    检查全部文件 按完成顺序逐个产出结果
+    :param files: 文件路径列表
+    :param jobs: 进程数 默认CPU核数 为1时在当前进程中检查
+    :param backend: 分词后端 各后端结果一致 默认使用最快的regex
+    :return: 生成器 dict
+    """
+    jobs = jobs or os.cpu_count() or 1
+    # 主进程先加载一次 文法产物/生成的模块写入缓存目录 工作进程直接读取
+    init_worker(config_path, mode, engine, backend)
+    if jobs == 1 or len(files) <= 1:
+        for path in files:
+            yield check_file(path)
+        return
+    with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker,
+                             initargs=(config_path, mode, engine, backend)) as pool:
+        futures = [pool.submit(check_batch, batch) for batch in split_batches(files, jobs)]
+        for future in as_completed(futures):
+            for res in future.result():
+                yield res
+
+
+class Summary():
+    """
+    汇总结果
+    """
+
+    def __init__(self):
+        self.counts = {STATUS_PASS: 0, STATUS_FAIL: 0, STATUS_ERROR: 0}
+        self.tokens = 0
+        self.start = perf_counter()
+        self.seconds = 0
+
+    def add(self, res):
+        self.counts[res['status']] += 1
+        self.tokens += res['tokens']
+        self.seconds = perf_counter() - self.start
+
+    @property
+    def files(self):
+        return sum(self.counts.values())
+
+    def as_dict(self):
+        return {'files': self.files, 'passed': self.counts[STATUS_PASS], 'failed': self.counts[STATUS_FAIL],
+                'errors': self.counts[STATUS_ERROR], 'tokens': self.tokens, 'seconds': self.seconds}
+
+    def format(self, jobs, head='[BatchChecker]: '):
+        seconds = self.seconds or 1e-9
+        return '\n'.join([
+            '%s共%d个文件 通过%d 失败%d 出错%d' % (head, self.files, self.counts[STATUS_PASS],
+                                         self.counts[STATUS_FAIL], self.counts[STATUS_ERROR]),
+            '%s合计%d个token 用时%.3fs %.1f文件/秒 %.0ftoken/秒 (%d个进程)' % (
+                head, self.tokens, self.seconds, self.files / seconds, self.tokens / seconds, jobs),
+        ])
+
+
+def format_result(res):
+    line = '%s %s (%d tokens, %.2fms)' % (res['status'].upper().ljust(5), res['path'], res['tokens'], res['ms'])
+    if res['msg']:
+        line += ': ' + res['msg']
+    return line
+
+
+"""
+    通过脚本方式调用
+    命令格式:
+        python BatchChecker.py [-j 进程数] [--mode lex|syntax] [--engine stack|fast|generated] [--backend classic|regex|dfa]
+                               [--json] [--quiet] 路径...
+            路径: 文件/目录(递归查找.c文件)/通配符(支持**)
+            全部通过时退出码为0 否则为1
+"""
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='PyCompiler 批量检查')
+    parser.add_argument('paths', nargs='+', help='文件/目录/通配符')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1, help='进程数 默认CPU核数')
+    parser.add_argument('--mode', choices=MODES, default='syntax', help='lex: 只做词法分析 syntax: 词法+语法检查')
+    parser.add_argument('--engine', choices=ENGINES, default=ENGINE_FAST, help='语法分析驱动程序')
+    parser.add_argument('--backend', choices=BACKENDS, default='regex', help='分词后端')
+    parser.add_argument('--config', default=CONFIG_PATH, help='文法配置文件')
+    parser.add_argument('--ext', default='.c', help='目录中要检查的扩展名 逗号分隔')
+    parser.add_argument('--json', action='store_true', help='每个文件输出一行JSON 最后一行为汇总')
+    parser.add_argument('--quiet', action='store_true', help='只输出未通过的文件和汇总')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    files = collect_files(args.paths, tuple(args.ext.split(',')))
+    jobs = max(1, min(args.jobs, len(files)))
+    summary = Summary()
+    for res in iter_results(files, jobs, args.config, args.mode, args.engine, args.backend):
+        summary.add(res)
+        if args.quiet and res['status'] == STATUS_PASS:
+            continue
+        if args.json:
+            print(json.dumps(res, ensure_ascii=False), flush=True)
+        else:
+            print(format_result(res), flush=True)
+    if args.json:
+        print(json.dumps({'summary': summary.as_dict()}, ensure_ascii=False))
+    else:
+        print(summary.format(jobs))
+    sys.exit(0 if summary.files == summary.counts[STATUS_PASS] else 1)
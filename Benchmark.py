@@ -0,0 +1,395 @@
+"""
+ 基准测试
+ 生成符合simple_c_grammar.xml的C语言子集程序作为语料 测量各阶段的吞吐量
+ 结果可保存为JSON基线 之后与基线比较 退化超过阈值时以非0状态退出
+ Implemented By Python
+"""
+
+import sys
+import gc
+import json
+import time
+import random
+import argparse
+import platform
+import tracemalloc
+import GrammarCompiler
+import ParserGenerator
+from Lexer import Lexer, BACKENDS
+from Syntaxer import Syntaxer, TRACE_OFF
+
+CONFIG_PATH = 'config/simple_c_grammar.xml'
+DEFAULT_SIZES = '1KB,100KB,1MB'
+DEFAULT_THRESHOLD = 0.2
+SIZE_UNITS = {'B': 1, 'KB': 1024, 'MB': 1024 * 1024}
+# 基线格式版本 测量项发生变化时递增
+BASELINE_VERSION = 1
+# 内存峰值的变化小于该字节数时不视为退化 避免很小的测量项因零星分配误报
+MEMORY_SLACK = 64 * 1024
+
+TYPES = ('int', 'float', 'char', 'bool')
+OPS = ('+', '-', '*', '/', '%', '>>', '<<', '==', '!=', '>=', '<=', '>', '<')
+FUNCS = ('printf', 'scanf', 'puts', 'check')
+
+
+class CorpusGenerator():
+    """
+    随机生成C语言子集程序 只使用文法接受的结构:
+    声明/赋值/函数调用/if/else/for/while/return/语句块 以及注释
+    相同的种子生成相同的程序
+    """
+
+    def __init__(self, seed=0):
+        self.rand = random.Random(seed)
+        self.names = {t: [] for t in TYPES}
+        self.counter = 0
+
+    def new_name(self, type):
+        self.counter += 1
+        name = '%s%d' % (type[0], self.counter)
+        self.names[type].append(name)
+        return name
+
+    def var(self):
+        return self.rand.choice(self.names['int'][-64:])
+
+    def num(self):
+        rand = self.rand
+        k = rand.randrange(4)
+        if k == 0:
+            return str(rand.randrange(1, 1000))
+        if k == 1:
+            return '%d.%d' % (rand.randrange(100), rand.randrange(100))
+        if k == 2:
+            return "'%s'" % rand.choice('abcxyz')
+        return rand.choice(('true', 'false'))
+
+    def val(self):
+        return self.var() if self.rand.random() < 0.6 else self.num()
+
+    def exp(self, depth=0):
+        rand = self.rand
+        k = rand.randrange(6)
+        if k == 0 and depth < 3:
+            return '(%s)' % self.exp(depth + 1)
+        if k == 1:
+            return '%s %s' % (self.var(), rand.choice(('++', '--')))
+        if k <= 3 and depth < 3:
+            return '%s %s %s' % (self.val(), rand.choice(OPS), self.exp(depth + 1))
+        return self.val()
+
+    def dec(self):
+        type = self.rand.choice(TYPES)
+        parts = []
+        for _ in range(self.rand.randrange(1, 4)):
+            name = self.new_name(type)
+            if self.rand.random() < 0.6:
+                parts.append('%s = %s' % (name, self.exp()))
+            else:
+                parts.append(name)
+        return '%s %s' % (type, ', '.join(parts))
+
+    def call(self):
+        args = [self.val() for _ in range(self.rand.randrange(3))]
+        if self.rand.random() < 0.5:
+            args.insert(0, '"%s\\n"' % ' '.join('%d' for _ in args))
+        return '%s(%s);' % (self.rand.choice(FUNCS), ', '.join(args))
+
+    def statement(self, indent, depth=0):
+        """
+        :return: list 代码行
+        """
+        rand = self.rand
+        pad = '    ' * indent
+        k = rand.randrange(10 if depth < 3 else 5)
+        if k == 0:
+            return [pad + self.dec() + ';']
+        if k == 1:
+            return [pad + '%s = %s;' % (self.var(), self.exp())]
+        if k == 2:
+            return [pad + self.call()]
+        if k == 3:
+            return [pad + '// %s' % self.var(), pad + self.dec() + ';']
+        if k == 4:
+            return [pad + '/* %s */ %s = %s;' % (self.num(), self.var(), self.exp())]
+        if k == 5:
+            lines = [pad + 'if (%s)' % self.exp()] + self.block(indent, depth + 1)
+            if rand.random() < 0.5:
+                lines += [pad + 'else'] + self.block(indent, depth + 1)
+            return lines
+        if k == 6:
+            return [pad + 'while (%s)' % self.exp()] + self.block(indent, depth + 1)
+        if k == 7:
+            name = self.new_name('int')
+            head = 'for (int %s = 0; %s < %s; %s ++)' % (name, name, self.val(), name)
+            return [pad + head] + self.block(indent, depth + 1)
+        if k == 8:
+            return self.block(indent, depth + 1)
+        return [pad + 'return %s;' % self.val()]
+
+    def block(self, indent, depth):
+        pad = '    ' * indent
+        lines = [pad + '{']
+        for _ in range(self.rand.randrange(1, 4)):
+            lines += self.statement(indent + 1, depth)
+        lines.append(pad + '}')
+        return lines
+
+    def iter_chunks(self, size):
+        """
+        生成约size字节的程序
+        :return: 生成器 str 代码块
+        """
+        # 先声明一个变量 赋值语句总有可用的左值
+        head = '#include<stdio.h>\n#include<stdlib.h>\nint main(){\n    int %s = 0;\n' % self.new_name('int')
+        tail = '    return 0;\n}\n'
+        yield head
+        total = len(head) + len(tail)
+        while total < size:
+            chunk = '\n'.join(self.statement(1)) + '\n'
+            total += len(chunk.encode('utf-8'))
+            yield chunk
+        yield tail
+
+
+def generate(size, seed=0):
+    """
+    生成约size字节的程序
+    :param size: 字节数
+    :param seed: 随机种子
+    :return: str
+    """
+    return ''.join(CorpusGenerator(seed).iter_chunks(size))
+
+
+def write_corpus(path, size, seed=0):
+    """
+    生成程序并写入文件 逐块写入 不在内存中保存整个程序
+    """
+    with open(path, 'w', encoding='utf-8') as f:
+        for chunk in CorpusGenerator(seed).iter_chunks(size):
+            f.write(chunk)
+
+
+def parse_size(s):
+    """
+    '100KB' -> 102400
+    """
+    s = s.strip().upper()
+    for unit in ('KB', 'MB', 'B'):
+        if s.endswith(unit):
+            return int(float(s[:-len(unit)]) * SIZE_UNITS[unit])
+    return int(s)
+
+
+def best_time(fn, repeat):
+    """
+    重复执行fn 取最短耗时
+    :return: (秒, 最后一次的返回值)
+    """
+    best = None
+    res = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        res = fn()
+        cost = time.perf_counter() - start
+        if best is None or cost < best:
+            best = cost
+    return best, res
+
+
+def peak_memory(fn):
+    """
+    fn执行期间Python分配内存的峰值(字节) 单独执行一次 不计入耗时
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_grammar(repeat, measure_memory=True):
+    """
+    文法加载耗时
+    compile: 由配置文本编译  load: 从磁盘产物加载(新进程启动时的情况)
+    """
+    syntaxer = Syntaxer(config_path=CONFIG_PATH, trace=TRACE_OFF)
+    with open(CONFIG_PATH, 'r', encoding='utf-8') as f:
+        config_raw = f.read()
+    syntaxer.load_grammar()
+    compile_time, _ = best_time(lambda: syntaxer.compile_grammar(config_raw), repeat)
+
+    def load():
+        GrammarCompiler.clear_loaded()
+        Syntaxer(config_path=CONFIG_PATH, trace=TRACE_OFF).load_grammar()
+    load_time, _ = best_time(load, repeat)
+    res = {'grammar.compile': {'seconds': compile_time}, 'grammar.load': {'seconds': load_time}}
+    if measure_memory:
+        res['grammar.compile']['peak_bytes'] = peak_memory(lambda: syntaxer.compile_grammar(config_raw))
+        res['grammar.load']['peak_bytes'] = peak_memory(load)
+    return res
+
+
+def bench_source(code_raw, repeat, measure_memory=True):
+    """
+    对一段程序测量各阶段
+    lex.<后端>: Lexer.run 每秒token数
+    syntax.<驱动程序>: 语法分析驱动程序 每秒步数 不含词法分析
+    :return: dict 测量项 -> 结果
+    """
+    res = {}
+    n_tokens = 0
+    for backend in BACKENDS:
+        lexer = Lexer(backend)
+        cost, lex_result = best_time(lambda: lexer.run(code_raw), repeat)
+        n_tokens = len(lex_result)
+        res['lex.%s' % backend] = {'seconds': cost, 'tokens': n_tokens, 'tokens_per_sec': n_tokens / cost}
+        del lex_result
+        if measure_memory:
+            res['lex.%s' % backend]['peak_bytes'] = peak_memory(lambda: lexer.run(code_raw))
+    syntaxer = Syntaxer(config_path=CONFIG_PATH, trace=TRACE_OFF)
+    syntaxer.load_grammar()
+    analysis = syntaxer.get_tokens(code_raw)
+    work, unknown = syntaxer.get_token_ids(code_raw)
+    parser = ParserGenerator.load_parser(syntaxer)
+
+    def stack():
+        ctx = syntaxer.new_context(TRACE_OFF)
+        syntaxer.driver(analysis, TRACE_OFF, ctx)
+        return ctx.is_match, ctx.summary
+
+    def fast():
+        ctx = syntaxer.new_context(TRACE_OFF)
+        syntaxer.fast_driver(work, unknown, TRACE_OFF, ctx)
+        return ctx.is_match, ctx.summary
+
+    engines = {'stack': stack, 'fast': fast, 'generated': lambda: parser.parse_ids(work, unknown)}
+    for name, fn in engines.items():
+        cost, (is_match, summary) = best_time(fn, repeat)
+        if not is_match:
+            raise Exception('语料未通过语法分析 请检查CorpusGenerator')
+        res['syntax.%s' % name] = {'seconds': cost, 'steps': summary['steps'], 'steps_per_sec': summary['steps'] / cost}
+        if measure_memory:
+            res['syntax.%s' % name]['peak_bytes'] = peak_memory(fn)
+    return res
+
+
+def run(sizes, repeat=3, seed=0, measure_memory=True, log=print):
+    """
+    执行全部测量
+    :param sizes: 语料大小列表(字节)
+    :return: dict 基线格式
+    """
+    results = {}
+    log('[Benchmark]: grammar')
+    results.update(bench_grammar(repeat, measure_memory))
+    for size in sizes:
+        code_raw = generate(size, seed)
+        label = '%dB' % size
+        log('[Benchmark]: corpus %s (%d bytes)' % (label, len(code_raw.encode('utf-8'))))
+        for name, value in bench_source(code_raw, repeat, measure_memory).items():
+            results['%s@%s' % (name, label)] = value
+        del code_raw
+    return {
+        'version': BASELINE_VERSION,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'seed': seed,
+        'results': results,
+    }
+
+
+def compare(current, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    与基线比较 吞吐量(*_per_sec)下降 或耗时/内存(seconds/peak_bytes)上升超过threshold即视为退化
+    有吞吐量的测量项只比较吞吐量 基线中没有的测量项不比较
+    :return: list (测量项, 指标, 基线值, 当前值, 变化比例) 只包含退化的项
+    """
+    if baseline.get('version') != BASELINE_VERSION:
+        raise Exception('基线格式版本不一致 请重新保存基线')
+    regressions = []
+    for name, value in current['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            continue
+        has_rate = any(metric.endswith('_per_sec') for metric in value)
+        for metric, cur in value.items():
+            old = base.get(metric)
+            if not old or metric in ('tokens', 'steps') or (has_rate and metric == 'seconds'):
+                continue
+            change = cur / old - 1
+            if metric.endswith('_per_sec'):
+                worse = change < -threshold
+            elif metric == 'peak_bytes':
+                worse = change > threshold and cur - old > MEMORY_SLACK
+            else:
+                worse = change > threshold
+            if worse:
+                regressions.append((name, metric, old, cur, change))
+    return regressions
+
+
+def format_results(report):
+    lines = []
+    for name, value in report['results'].items():
+        parts = ['%.3fms' % (value['seconds'] * 1000)]
+        if 'tokens_per_sec' in value:
+            parts.append('%.0f tokens/s' % value['tokens_per_sec'])
+        if 'steps_per_sec' in value:
+            parts.append('%.0f steps/s' % value['steps_per_sec'])
+        if 'peak_bytes' in value:
+            parts.append('peak %.1fKB' % (value['peak_bytes'] / 1024))
+        lines.append('[Benchmark]: %s %s' % (name.ljust(28), '  '.join(parts)))
+    return '\n'.join(lines)
+
+
+"""
+    通过脚本方式调用
+    命令格式:
+        python Benchmark.py [--sizes 1KB,100KB,1MB] [--repeat 3] [--save baseline.json] [--compare baseline.json] [--threshold 0.2]
+            运行基准测试 --save保存结果为基线 --compare与基线比较 退化时退出码为1
+        python Benchmark.py --generate out.c --size 10MB [--seed 0]
+            只生成语料
+"""
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='PyCompiler 基准测试')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='语料大小 逗号分隔 例如1KB,100KB,1MB,100MB')
+    parser.add_argument('--repeat', type=int, default=3, help='每项重复次数 取最短耗时')
+    parser.add_argument('--seed', type=int, default=0, help='语料随机种子')
+    parser.add_argument('--no-memory', action='store_true', help='不测量内存峰值(tracemalloc会使测量变慢)')
+    parser.add_argument('--save', help='将结果保存为基线')
+    parser.add_argument('--compare', help='与基线比较')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='允许的退化比例')
+    parser.add_argument('--generate', help='只生成语料到该文件')
+    parser.add_argument('--size', default='1MB', help='--generate生成的语料大小')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.generate:
+        write_corpus(args.generate, parse_size(args.size), args.seed)
+        print('[Benchmark]: %s -> %s' % (args.size, args.generate))
+        sys.exit(0)
+    sizes = [parse_size(s) for s in args.sizes.split(',') if s.strip()]
+    report = run(sizes, args.repeat, args.seed, not args.no_memory)
+    print(format_results(report))
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print('[Benchmark]: 基线已保存到%s' % args.save)
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        for name, metric, old, cur, change in regressions:
+            print('[Benchmark]: 退化 %s %s %.4g -> %.4g (%+.1f%%)' % (name, metric, old, cur, change * 100))
+        if regressions:
+            sys.exit(1)
+        print('[Benchmark]: 与基线相比没有超过%.0f%%的退化' % (args.threshold * 100))
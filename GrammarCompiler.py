@@ -0,0 +1,322 @@
+"""
+ 文法编译器
+ 将XML文法配置编译为LL(1)分析产物(终结符/非终结符/产生式/SELECT集/预测表)
+ 产物以配置文件内容的哈希为键缓存到磁盘 进程内只读取一次
+ 产物只含内置容器与字符串/整数 以marshal序列化 读取缓存文件不会执行其中的代码
+ 每次加载都从序列化数据还原出一份新的产物 各调用方修改自己的副本不会影响其他调用方
+ Implemented By Python
+"""
+
+import os
+import sys
+import hashlib
+import marshal
+
+# 产物格式版本 产物结构发生变化时递增 旧版本产物自动失效
+ARTIFACT_VERSION = 5
+# 磁盘缓存目录名 位于配置文件所在目录下
+CACHE_DIR_NAME = '.grammar_cache'
+
+# 进程内缓存 配置文件绝对路径 -> (文件状态, 内容哈希, 序列化的产物)
+_loaded = {}
+
+
+def config_digest(config_raw: bytes):
+    """
+    计算配置内容的哈希 产物版本号参与计算
+    :param config_raw: 配置文件原始字节
+    :return: str 十六进制哈希
+    """
+    h = hashlib.sha256()
+    h.update(('v%d\n' % ARTIFACT_VERSION).encode('utf-8'))
+    h.update(config_raw)
+    return h.hexdigest()
+
+
+def artifact_path(config_path, digest):
+    """
+    产物在磁盘上的存放路径
+    :param config_path: 配置文件路径
+    :param digest: 配置内容哈希
+    :return: str
+    """
+    config_dir, config_name = os.path.split(os.path.abspath(config_path))
+    name = '%s.%s.marshal' % (os.path.splitext(config_name)[0], digest[:16])
+    return os.path.join(config_dir, CACHE_DIR_NAME, name)
+
+
+def read_artifact(path, digest):
+    """
+    从磁盘读取序列化的产物 版本或哈希不一致/文件损坏时返回None
+    :return: bytes or None
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        artifact = marshal.loads(data)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    if not isinstance(artifact, dict):
+        return None
+    if artifact.get('version') != ARTIFACT_VERSION or artifact.get('digest') != digest:
+        return None
+    return data
+
+
+def write_artifact(path, data):
+    """
+    将序列化的产物写入磁盘 先写临时文件再替换 避免并发读到半个文件
+    目录不可写时静默跳过 只使用进程内缓存
+    """
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def load_artifact(config_path, compile_fn, digest=None):
+    """
+    获取配置文件对应的编译产物
+    1. 进程内已读取且配置文件未变化 使用已读取的数据
+    2. 磁盘上有与内容哈希一致的产物 读取
+    3. 否则调用compile_fn重新编译 并写回磁盘
+    :param config_path: 配置文件路径
+    :param compile_fn: 编译函数 参数为配置文本 返回产物dict
+    :param digest: 调用方已持有的产物哈希 与当前产物一致时返回None 省去还原
+    :return: dict 产物的新副本 or None
+    """
+    key = os.path.abspath(config_path)
+    st = os.stat(key)
+    stat_key = (st.st_mtime_ns, st.st_size)
+    cached = _loaded.get(key)
+    if cached is None or cached[0] != stat_key:
+        cached = read_config(key, stat_key, cached, compile_fn)
+    if cached[1] == digest:
+        return None
+    return marshal.loads(cached[2])
+
+
+def read_config(key, stat_key, cached, compile_fn):
+    """
+    配置文件未加载或已变化时 读取/编译产物 并更新进程内缓存
+    :return: (文件状态, 内容哈希, 序列化的产物)
+    """
+    with open(key, 'rb') as f:
+        config_raw = f.read()
+    digest = config_digest(config_raw)
+    if cached is not None and cached[1] == digest:
+        # 文件被touch过 但内容没变
+        _loaded[key] = (stat_key, digest, cached[2])
+        return _loaded[key]
+    path = artifact_path(key, digest)
+    data = read_artifact(path, digest)
+    if data is None:
+        artifact = compile_fn(config_raw.decode('utf-8'))
+        artifact['version'] = ARTIFACT_VERSION
+        artifact['digest'] = digest
+        data = marshal.dumps(artifact)
+        write_artifact(path, data)
+    _loaded[key] = (stat_key, digest, data)
+    return _loaded[key]
+
+
+class GrammarAnalysis():
+    """
+    文法分析结果 nullable/FIRST/FOLLOW/SELECT
+    符号集合用整数位集表示: 第i位为1 表示集合中包含第i个终结符
+    """
+
+    def __init__(self, terminals: list):
+        self.terminals = terminals  # 位号 -> 终结符
+        self.bit = {v: 1 << i for i, v in enumerate(terminals)}  # 终结符 -> 位
+        self.nullable = set()  # 能推导出空串的非终结符
+        self.first = {}  # 非终结符 -> FIRST位集(不含空串)
+        self.follow = {}  # 非终结符 -> FOLLOW位集
+        self.select = {}  # (非终结符, 产生式右部) -> SELECT位集
+        self.rules = {}  # 非终结符 -> [产生式右部]
+
+    def to_list(self, bits):
+        """
+        位集转换为终结符列表 按终结符声明顺序
+        :param bits: 位集
+        :return: list
+        """
+        res = []
+        i = 0
+        while bits:
+            if bits & 1:
+                res.append(self.terminals[i])
+            bits >>= 1
+            i += 1
+        return res
+
+    def conflicts(self):
+        """
+        检查LL(1)冲突: 同一非终结符的各产生式select集两两不相交
+        :return: list [(非终结符, 产生式a, 产生式b, 冲突的终结符列表)]
+        """
+        res = []
+        for vn, generate_list in self.rules.items():
+            seen = 0
+            for i, generate in enumerate(generate_list):
+                bits = self.select[(vn, generate)]
+                if bits & seen:
+                    for other in generate_list[:i]:
+                        common = bits & self.select[(vn, other)]
+                        if common:
+                            res.append((vn, other, generate, self.to_list(common)))
+                seen |= bits
+        return res
+
+
+def analyze(vt: list, vn: list, grammar: dict, start_v, empty='@', end='#'):
+    """
+    工作表不动点算法 一次性求出nullable/FIRST/FOLLOW/SELECT
+    每个集合的增长沿依赖边传播 总代价与文法规模及终结符数成线性关系
+    :param vt: 终结符 可包含空串符号
+    :param vn: 非终结符
+    :param grammar: 文法 非终结符 -> [产生式右部]
+    :param start_v: 文法开始符
+    :param empty: 空串符号
+    :param end: 输入结束符
+    :return: GrammarAnalysis
+    """
+    result = GrammarAnalysis([v for v in vt if v != empty])
+    bit = result.bit
+    vn_set = set(vn)
+    # 产生式列表 (左部, 右部符号元组(已去掉空串), 原始右部)
+    rules = []
+    for _vn in vn:
+        result.rules[_vn] = list(grammar[_vn])
+        for generate in grammar[_vn]:
+            symbols = tuple(v for v in generate if v != empty)
+            for v in symbols:
+                if v not in vn_set and v not in bit:
+                    raise Exception("文法中出现未声明的符号: %s" % v)
+            rules.append((_vn, symbols, generate))
+
+    # nullable: 记录每条产生式中尚未确定可空的符号数 降为0时左部可空
+    nullable = result.nullable
+    remain = []
+    occurs = {_vn: [] for _vn in vn}  # 非终结符 -> 右部出现它的产生式编号 每出现一次记录一次
+    work = []
+    for k, (_vn, symbols, _) in enumerate(rules):
+        remain.append(len(symbols))
+        for v in symbols:
+            if v in vn_set:
+                occurs[v].append(k)
+        if not symbols and _vn not in nullable:
+            nullable.add(_vn)
+            work.append(_vn)
+    while work:
+        v = work.pop()
+        for k in occurs[v]:
+            remain[k] -= 1
+            if remain[k] == 0 and rules[k][0] not in nullable:
+                nullable.add(rules[k][0])
+                work.append(rules[k][0])
+
+    def propagate(sets, edges):
+        """
+        沿边 a -> b (sets[a] 包含于 sets[b]) 传播位集直到不动点
+        """
+        work = [v for v in vn if sets[v]]
+        pending = set(work)
+        while work:
+            a = work.pop()
+            pending.discard(a)
+            bits = sets[a]
+            for b in edges[a]:
+                merged = sets[b] | bits
+                if merged != sets[b]:
+                    sets[b] = merged
+                    if b not in pending:
+                        pending.add(b)
+                        work.append(b)
+
+    # FIRST: 右部可空前缀后的第一个符号 其FIRST并入左部
+    first = result.first
+    first_edges = {_vn: set() for _vn in vn}
+    for _vn in vn:
+        first[_vn] = 0
+    for _vn, symbols, _ in rules:
+        for v in symbols:
+            if v in vn_set:
+                first_edges[v].add(_vn)
+                if v not in nullable:
+                    break
+            else:
+                first[_vn] |= bit[v]
+                break
+    propagate(first, first_edges)
+
+    def suffix_first(symbols):
+        """
+        从右向左求右部各后缀的FIRST位集与可空性
+        :return: list [(位集, 是否可空)] 下标k对应symbols[k:] 末尾为空后缀
+        """
+        res = [(0, True)] * (len(symbols) + 1)
+        for k in range(len(symbols) - 1, -1, -1):
+            v = symbols[k]
+            if v in vn_set:
+                bits, can_empty = res[k + 1]
+                if v in nullable:
+                    res[k] = (first[v] | bits, can_empty)
+                else:
+                    res[k] = (first[v], False)
+            else:
+                res[k] = (bit[v], False)
+        return res
+
+    # FOLLOW: A→αBβ 则FIRST(β)并入FOLLOW(B) β可空时FOLLOW(A)并入FOLLOW(B)
+    follow = result.follow
+    follow_edges = {_vn: set() for _vn in vn}
+    for _vn in vn:
+        follow[_vn] = 0
+    follow[start_v] |= bit[end]
+    suffixes = []
+    for _vn, symbols, _ in rules:
+        suffix = suffix_first(symbols)
+        suffixes.append(suffix)
+        for k, v in enumerate(symbols):
+            if v in vn_set:
+                bits, can_empty = suffix[k + 1]
+                follow[v] |= bits
+                if can_empty and v != _vn:
+                    follow_edges[_vn].add(v)
+    propagate(follow, follow_edges)
+
+    # SELECT
+    for (_vn, symbols, generate), suffix in zip(rules, suffixes):
+        bits, can_empty = suffix[0]
+        if can_empty:
+            bits |= follow[_vn]
+        result.select[(_vn, generate)] = bits
+    return result
+
+
+def clear_loaded():
+    """
+    清空进程内缓存(磁盘产物保留)
+    """
+    _loaded.clear()
+
+
+"""
+    通过脚本方式预编译文法
+    命令格式:
+        python GrammarCompiler.py [config_path]
+"""
+
+
+if __name__ == '__main__':
+    from Syntaxer import Syntaxer
+    config_path = sys.argv[1] if len(sys.argv) > 1 else 'config/simple_c_grammar.xml'
+    syntaxer = Syntaxer(config_path=config_path)
+    syntaxer.load_grammar()
+    print('[GrammarCompiler]: %s -> %s' % (config_path, artifact_path(config_path, syntaxer.grammar_digest)))
@@ -0,0 +1,120 @@
+"""
+ 词法分析结果的二进制传输格式
+ 按列存放: token文本去重后组成字符串表 每个token只记录字符串编号/类型编号/起点
+ 格式(小端):
+    头部16字节: 魔数b'PCLX' u16版本 u16类型数 u32字符串数 u32 token数
+    字符串表: u32偏移 * (字符串数+1) 之后是utf-8编码的字符串数据 末尾补齐到4字节
+        前"类型数"个字符串为类型名 类型编号k的名称为第k个字符串
+    token列: u32字符串编号 * token数, u32起点(源代码中的字符位置) * token数, u8类型编号 * token数
+ decode为参考解码器 只依赖标准库
+ Implemented By Python
+"""
+
+import sys
+import struct
+from array import array
+
+MAGIC = b'PCLX'
+WIRE_VERSION = 1
+MIME_TYPE = 'application/x-pycompiler-lex'
+HEADER = struct.Struct('<4sHHII')
+
+
+def little_endian(arr):
+    """
+    将array转为小端字节序的bytes
+    """
+    if sys.byteorder == 'big':
+        arr = array(arr.typecode, arr)
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def from_little_endian(typecode, data):
+    """
+    由小端字节序的bytes构造array
+    """
+    arr = array(typecode)
+    arr.frombytes(data)
+    if sys.byteorder == 'big':
+        arr.byteswap()
+    return arr
+
+
+def encode(src, spans, type_names):
+    """
+    编码词法分析结果
+    :param src: 源代码
+    :param spans: 可迭代对象 (类型编号, 起点, 终点) 位置为src中的字符位置
+    :param type_names: 类型编号 -> 类型名 未使用的编号为''
+    :return: bytes
+    """
+    strings = list(type_names)
+    index = {}
+    ids = array('I')
+    starts = array('I')
+    types = array('B')
+    for type, start, end in spans:
+        token = src[start:end]
+        i = index.get(token)
+        if i is None:
+            i = index[token] = len(strings)
+            strings.append(token)
+        ids.append(i)
+        starts.append(start)
+        types.append(type)
+    offsets = array('I', [0])
+    blobs = []
+    size = 0
+    for s in strings:
+        b = s.encode('utf-8', 'surrogatepass')
+        blobs.append(b)
+        size += len(b)
+        offsets.append(size)
+    blobs.append(b'\0' * (-size % 4))
+    return b''.join([
+        HEADER.pack(MAGIC, WIRE_VERSION, len(type_names), len(strings), len(ids)),
+        little_endian(offsets),
+        b''.join(blobs),
+        little_endian(ids),
+        little_endian(starts),
+        types.tobytes(),
+    ])
+
+
+def decode(data):
+    """
+    参考解码器
+    :param data: encode得到的bytes
+    :return: dict type_names: 类型名列表 strings: 字符串表 ids/starts/types: 每个token的字符串编号/起点/类型编号
+    """
+    data = memoryview(data)
+    magic, version, n_types, n_strings, n_tokens = HEADER.unpack_from(data)
+    if magic != MAGIC or version != WIRE_VERSION:
+        raise ValueError('不支持的格式: %r 版本%d' % (bytes(magic), version))
+    p = HEADER.size
+    offsets = from_little_endian('I', data[p:p + 4 * (n_strings + 1)])
+    p += 4 * (n_strings + 1)
+    blob = bytes(data[p:p + offsets[-1]])
+    p += offsets[-1] + (-offsets[-1] % 4)
+    strings = [blob[offsets[i]:offsets[i + 1]].decode('utf-8', 'surrogatepass') for i in range(n_strings)]
+    ids = from_little_endian('I', data[p:p + 4 * n_tokens])
+    p += 4 * n_tokens
+    starts = from_little_endian('I', data[p:p + 4 * n_tokens])
+    p += 4 * n_tokens
+    types = array('B', data[p:p + n_tokens])
+    return {'type_names': strings[:n_types], 'strings': strings, 'ids': ids, 'starts': starts, 'types': types}
+
+
+def lex_lines(decoded):
+    """
+    还原为/getLex的JSON格式结果(第一行为表头)
+    :param decoded: decode的结果
+    :return: list
+    """
+    strings = decoded['strings']
+    type_names = decoded['type_names']
+    lines = ["%s %s" % ("Token".ljust(20), "Type")]
+    for i, t in zip(decoded['ids'], decoded['types']):
+        lines.append("%s %s" % (strings[i].ljust(20), type_names[t]))
+    return lines
@@ -6,7 +6,14 @@
 import sys
 import re
 import os
+import io
+import codecs
+import mmap
+from bisect import bisect_right
+from array import array
 from enum import Enum
+import LexerGenerator
+from Profiler import PhaseTimes
 
 
 """
@@ -26,6 +33,39 @@ Operator = ['+', '-', '*', '/', '<', '<=', '>', '>=', '=', '==', '!=', '^', '%',
 # 分界符
 Delimiter = [';', ':', '[', ']', '(', ')', '{', '}', '<', '>', ',', '.', '#', '"', '\'']
 
+# 流式读取时每块的字符数
+CHUNK_SIZE = 64 * 1024
+# 命令行批量输出时每批的行数
+OUTPUT_BATCH = 4096
+# 空白字符
+Space = frozenset(' \t\r\n')
+OperatorSet = frozenset(Operator)
+DelimiterSet = frozenset(Delimiter)
+
+# 按token首字符分派类型判断
+FIRST_OTHER = 0  # 其他字符: 只可能是运算符/分界符
+FIRST_LETTER = 1  # 字母或_: 布尔常量/标识符
+FIRST_DIGIT = 2  # 数字: 整型/浮点型常量
+FIRST_DOT = 3  # .: 分界符/浮点型常量
+FIRST_QUOTE = 4  # 引号: 分界符/字符串/字符常量
+FirstChar = {}
+for _ch in 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ_':
+    FirstChar[_ch] = FIRST_LETTER
+for _ch in '0123456789':
+    FirstChar[_ch] = FIRST_DIGIT
+FirstChar['.'] = FIRST_DOT
+FirstChar['"'] = FIRST_QUOTE
+FirstChar['\''] = FIRST_QUOTE
+# 与is_int_constant/is_float_constant/is_identifier的状态机等价
+INT_PATTERN = re.compile(r'0|[1-9][0-9]*')
+FLOAT_PATTERN = re.compile(r'[0-9]*\.[0-9]*')
+IDENTIFIER_PATTERN = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+# 预处理时需要特殊处理的字符: 注释开始/字符串开始
+PREPROCESS_SPECIAL = re.compile(r'["\'/]')
+QUOTE = re.compile(r'["\']')
+# 可选的分词后端 classic:双指针分词+逐个判断类型  regex:单个正则一次扫描  dfa:生成的DFA转移表驱动
+BACKENDS = ('classic', 'regex', 'dfa')
+
 
 # type = 保留字/运算符/标识符/整型常量/浮点型常量/布尔型常量/分界符/字符串型常量/字符型常量
 class TOKEN_TYPE(Enum):
@@ -43,6 +83,208 @@ class TOKEN_TYPE(Enum):
     CharReserved = 12
 
 
+def build_master_pattern():
+    """
+    由token表构造总正则 各类token作为命名分组组成一个交替式
+    分词规则与split_token一致:
+        1. 注释视为空白 字符串常量中的//和/*不是注释
+        2. 字符串/字符常量从引号开始到下一个引号(任意一种)结束
+        3. 运算符取最长匹配
+        4. 其余字符组成的词在空格/运算符/分界符/引号处断开 与数字相邻的.不断开
+    :return: 编译好的正则
+    """
+    quotes = '"\''
+    op_chars = ''.join(sorted({op[0] for op in Operator} | {ch for op in Operator for ch in op}))
+    stop_chars = ' \t\r\n' + quotes + op_chars + ''.join(d for d in Delimiter if len(d) == 1)
+    word_char = '[^%s]' % re.escape(stop_chars)
+    # 词的延续: 普通字符 或 与数字相邻的.
+    word_cont = r'(?:%s|\.(?=[0-9])|(?<=[0-9])\.)' % word_char
+    word_end = '(?!%s)' % word_cont
+    operators = '|'.join(re.escape(op) for op in sorted(Operator, key=len, reverse=True))
+    delimiters = '|'.join(re.escape(d) for d in Delimiter if d not in quotes and d not in Operator)
+    pattern = '|'.join([
+        r'(?P<space>[ \t\r\n]+)',
+        r'(?P<comment>//[^\n]*|/(?=\*)[\s\S]*?(?:\*/|\Z))',
+        r'(?P<string>["\'][^"\']*["\']?)',
+        r'(?P<float>(?:[0-9]+\.[0-9]*|\.[0-9]+)%s)' % word_end,
+        r'(?P<int>(?:0|[1-9][0-9]*)%s)' % word_end,
+        r'(?P<name>[A-Za-z_][A-Za-z0-9_]*%s)' % word_end,
+        r'(?P<word>%s+)' % word_cont,
+        r'(?P<operator>%s)' % operators,
+        r'(?P<delimiter>%s)' % delimiters,
+    ])
+    return re.compile(pattern)
+
+
+MASTER_PATTERN = build_master_pattern()
+
+
+# 扫描器给出的种类 -> token类型 未列出的种类需要进一步判断
+KIND_TYPES = {
+    'reserved': TOKEN_TYPE.Reserved,
+    'bool': TOKEN_TYPE.BoolConstant,
+    'float': TOKEN_TYPE.FloatConstant,
+    'int': TOKEN_TYPE.IntConstant,
+    'name': TOKEN_TYPE.Identifier,
+    'operator': TOKEN_TYPE.Operator,
+    'delimiter': TOKEN_TYPE.Delimiter,
+}
+
+
+class OffsetMap():
+    """
+    预处理后代码中的位置 -> 原始代码中的位置/行列
+    预处理只会把注释替换为一个空格 所以按连续片段记录即可:
+    seg_pre[k]为第k个片段在预处理结果中的起点 seg_raw[k]为它在原始代码中的起点
+    """
+
+    def __init__(self, src_raw=''):
+        self.seg_pre = array('q', [0])
+        self.seg_raw = array('q', [0])
+        # 每一行在原始代码中的起点
+        self.line_starts = array('q', [0])
+        self.line_starts.extend(m.end() for m in re.finditer('\n', src_raw))
+
+    def add(self, pre, raw):
+        """
+        新增一个片段
+        :param pre: 片段在预处理结果中的起点
+        :param raw: 片段在原始代码中的起点
+        :return:
+        """
+        if self.seg_pre[-1] == pre:
+            self.seg_raw[-1] = raw
+        else:
+            self.seg_pre.append(pre)
+            self.seg_raw.append(raw)
+
+    def to_raw(self, pos):
+        """
+        :param pos: 预处理结果中的位置
+        :return: 原始代码中的位置
+        """
+        k = bisect_right(self.seg_pre, pos) - 1
+        return self.seg_raw[k] + pos - self.seg_pre[k]
+
+    def line_col(self, pos):
+        """
+        :param pos: 预处理结果中的位置
+        :return: (行, 列) 均从1开始
+        """
+        raw = self.to_raw(pos)
+        line = bisect_right(self.line_starts, raw) - 1
+        return line + 1, raw - self.line_starts[line] + 1
+
+
+class CommentStripper():
+    """
+    线性时间去除注释 每个注释替换为一个空格 字符串常量(引号到下一个引号)原样保留
+    按片段查找特殊字符并切片拼接 可按块多次喂入 注释/字符串状态在块之间保持
+    """
+
+    def __init__(self, offset_map: OffsetMap = None):
+        self.mode = 0  # 0:代码 1://类注释 2:/* */类注释 3:字符串常量
+        self.carry = ''  # 上一块末尾尚未处理的字符
+        self.offset_map = offset_map
+        self.consumed = 0  # 已喂入的原始字符数
+        self.out_len = 0  # 已产出的字符数
+        self.expect_raw = 0  # 下一个产出字符在连续时对应的原始位置
+
+    def emit(self, out, piece, raw):
+        if not piece:
+            return
+        if self.offset_map is not None and raw != self.expect_raw:
+            self.offset_map.add(self.out_len, raw)
+        out.append(piece)
+        self.out_len += len(piece)
+        self.expect_raw = raw + len(piece)
+
+    def feed(self, chunk, final=False):
+        """
+        处理一块原始代码
+        :param chunk: 原始代码块
+        :param final: 是否为最后一块
+        :return: str 本块的处理结果
+        """
+        text = self.carry + chunk
+        base = self.consumed - len(self.carry)  # text[0]在原始代码中的位置
+        self.consumed += len(chunk)
+        self.carry = ''
+        length = len(text)
+        out = []
+        p = 0
+        while p < length:
+            if self.mode == 1:
+                # 寻找结束标记\n \n本身保留
+                k = text.find('\n', p)
+                if k < 0:
+                    break
+                self.mode = 0
+                p = k
+            elif self.mode == 2:
+                # 寻找结束标记*/ 开始标记中的*也参与匹配
+                k = text.find('*/', p)
+                if k < 0:
+                    if not final and length - 1 >= p and text[-1] == '*':
+                        self.carry = '*'
+                    break
+                self.mode = 0
+                p = k + 2
+            elif self.mode == 3:
+                # 字符串常量 到下一个引号为止
+                m = QUOTE.search(text, p)
+                if m is None:
+                    self.emit(out, text[p:], base + p)
+                    break
+                self.emit(out, text[p:m.end()], base + p)
+                self.mode = 0
+                p = m.end()
+            else:
+                m = PREPROCESS_SPECIAL.search(text, p)
+                if m is None:
+                    self.emit(out, text[p:], base + p)
+                    break
+                k = m.start()
+                self.emit(out, text[p:k], base + p)
+                if text[k] != '/':
+                    self.mode = 3
+                    self.emit(out, text[k], base + k)
+                    p = k + 1
+                    continue
+                if k == length - 1 and not final:
+                    # 块末尾的/ 需要看下一块的第一个字符
+                    self.carry = '/'
+                    break
+                nxt = text[k + 1] if k + 1 < length else ''
+                if nxt == '/':
+                    self.mode = 1
+                    self.emit(out, ' ', base + k)
+                    p = k + 2
+                elif nxt == '*':
+                    self.mode = 2
+                    self.emit(out, ' ', base + k)
+                    p = k + 1
+                else:
+                    self.emit(out, '/', base + k)
+                    p = k + 1
+        return ''.join(out)
+
+    def finish(self):
+        """
+        输入结束 处理剩余的字符
+        :return: str
+        """
+        if self.carry:
+            return self.feed('', final=True)
+        return ''
+
+
+# TOKEN_TYPE值 -> TOKEN_TYPE
+TYPE_BY_CODE = [None] * (max(t.value for t in TOKEN_TYPE) + 1)
+for _type in TOKEN_TYPE:
+    TYPE_BY_CODE[_type.value] = _type
+
+
 class lex():
     def __init__(self, token, type):
         self.token = token
@@ -51,6 +293,77 @@ class lex():
     def __str__(self):
         s = ''
         return "%s %s"%(self.token.ljust(20),self.type)
+
+
+class TokenBuffer():
+    """
+    按列存储的词法分析结果 每列是一个array
+    types[k]: TOKEN_TYPE值  starts[k]: 在原始代码中的起点  lengths[k]: 长度  lines[k]/cols[k]: 行列(从1开始)
+    token文本引用原始代码 需要时才切片 按下标/迭代访问时得到与run结果相同的lex
+    """
+
+    def __init__(self, src, type_name=None):
+        self.src = src  # 原始代码
+        self.type_name = type_name  # (TOKEN_TYPE, token) -> lex.type 为None时直接使用TOKEN_TYPE
+        self.types = array('B')
+        self.starts = array('q')
+        self.lengths = array('l')
+        self.lines = array('l')
+        self.cols = array('l')
+
+    def append(self, type, start, length, line, col):
+        self.types.append(type.value)
+        self.starts.append(start)
+        self.lengths.append(length)
+        self.lines.append(line)
+        self.cols.append(col)
+
+    def __len__(self):
+        return len(self.types)
+
+    def text(self, k):
+        start = self.starts[k]
+        return self.src[start:start + self.lengths[k]]
+
+    def type(self, k):
+        return TYPE_BY_CODE[self.types[k]]
+
+    def position(self, k):
+        """
+        :return: (行, 列)
+        """
+        return self.lines[k], self.cols[k]
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            return [self[i] for i in range(*k.indices(len(self)))]
+        if k < 0:
+            k += len(self)
+        token = self.text(k)
+        type = TYPE_BY_CODE[self.types[k]]
+        if self.type_name is not None:
+            type = self.type_name(type, token)
+        return lex(token, type)
+
+    def __iter__(self):
+        for k in range(len(self)):
+            yield self[k]
+
+
+class LexContext():
+    """
+    一次词法分析的中间结果与结果
+    """
+
+    def __init__(self, src_raw):
+        self.src_raw = src_raw  # 初始源代码
+        self.src_preprocessed = ''  # 经过预处理后得到的代码串
+        self.offset_map = None  # 预处理后位置 -> 原始行列
+        self.tokens = []  # 经过分词得到的token列表
+        self.lex_result = []  # 词法分析结果
+        self.times = PhaseTimes()  # 各阶段耗时
+
+
 """
     词法分析器
     run方法 输入代码文本 返回词法分析结果表
@@ -58,11 +371,19 @@ class lex():
 
 
 class Lexer():
-    def __init__(self):
+    # 保留字表 子类可替换
+    reserved = Reserved
+
+    def __init__(self, backend='classic'):
+        assert backend in BACKENDS, '未知的分词后端: %s' % backend
+        self.backend = backend  # 分词后端
+        self.reserved_set = frozenset(self.reserved)
         self.src_raw = ''  # 初始源代码
         self.src_preprocessed = ''  # 经过预处理后得到的代码串
+        self.offset_map = None  # 预处理后位置 -> 原始行列
         self.tokens = []  # 经过分词得到的token列表
         self.lex_result = []  # 词法分析结果
+        self.times = PhaseTimes()  # 最近一次run的各阶段耗时
 
     """
         将tokens列表转化为词法分析结果 lex_result
@@ -89,6 +410,67 @@ class Lexer():
     """
 
     def get_token_type(self, token):
+        type = self.classify(token)
+        if type is None:
+            # 如果都没识别出来 抛出异常 报错
+            assert False,"错误: 无法识别%s的含义" % token
+        return self.type_name(type, token)
+
+    """
+        通过token判断其TOKEN_TYPE 无法识别时返回None
+        先查保留字表 再按首字符分派 每个token只做常数次查表/匹配
+        结果与classify_by_rules逐个判断的结果一致
+        @param token
+        @return TOKEN_TYPE or None
+    """
+
+    def classify(self, token):
+        if not token or token[0] in Space or token[-1] in Space:
+            # 两端带空白的token 各判断函数是否strip不一致 按规则逐个判断
+            return self.classify_by_rules(token)
+        if token in self.reserved_set:
+            return TOKEN_TYPE.Reserved
+        first = FirstChar.get(token[0], FIRST_OTHER)
+        if first == FIRST_LETTER:
+            if token == 'true' or token == 'false':
+                return TOKEN_TYPE.BoolConstant
+            if IDENTIFIER_PATTERN.fullmatch(token):
+                return TOKEN_TYPE.Identifier
+            return None
+        if first == FIRST_DIGIT:
+            if INT_PATTERN.fullmatch(token):
+                return TOKEN_TYPE.IntConstant
+            if FLOAT_PATTERN.fullmatch(token):
+                return TOKEN_TYPE.FloatConstant
+            return None
+        if first == FIRST_DOT:
+            if token in DelimiterSet:
+                return TOKEN_TYPE.Delimiter
+            if FLOAT_PATTERN.fullmatch(token):
+                return TOKEN_TYPE.FloatConstant
+            return None
+        if first == FIRST_QUOTE:
+            if token in DelimiterSet:
+                return TOKEN_TYPE.Delimiter
+            if self.is_string_constant(token):
+                return TOKEN_TYPE.StringConstant
+            if self.is_char_constant(token):
+                return TOKEN_TYPE.CharConstant
+            return None
+        if token in OperatorSet:
+            return TOKEN_TYPE.Operator
+        if token in DelimiterSet:
+            return TOKEN_TYPE.Delimiter
+        return None
+
+    """
+        按规则逐个判断token的TOKEN_TYPE 无法识别时返回None
+        获得token类型 type = 保留字/运算符/标识符/整型常量/实型常量/布尔型常量/字符型常量/字符串型常量/分界符
+        @param token
+        @return TOKEN_TYPE or None
+    """
+
+    def classify_by_rules(self, token):
         if self.is_reserved(token):
             return TOKEN_TYPE.Reserved
         if self.is_operator(token):
@@ -107,8 +489,17 @@ class Lexer():
             return TOKEN_TYPE.StringConstant
         if self.is_char_constant(token):
             return TOKEN_TYPE.CharConstant
-        # 如果上面的都没识别出来 抛出异常 报错
-        assert False,"错误: 无法识别%s的含义" % token
+        return None
+
+    """
+        TOKEN_TYPE -> 对外给出的token类型 子类可重写
+        @param type TOKEN_TYPE
+        @param token
+        @return type
+    """
+
+    def type_name(self, type, token):
+        return type
 
     """
         对预处理后的源代码进行分词获得token列表
@@ -123,10 +514,18 @@ class Lexer():
     """
 
     def split_token(self, src_preprocessed):
+        return [src_preprocessed[i:j].strip() for i, j in self.split_spans(src_preprocessed)]
+
+    """
+        分词的位置版本 逐个产出token在预处理后代码中的区间
+        @param src_preprocessed 预处理后的代码
+        @return 生成器 (i, j) 表示src[i:j]为一个token(未strip)
+    """
+
+    def split_spans(self, src_preprocessed):
         src = src_preprocessed
         length = len(src)
         i = j = 0  # 双指针 i j 一前一后用来分词 src[i, j)为分词结果
-        tokens = []
         while i < length:
             need_split = True  # 分词标志 用来区分当前区域是否需要分词
             handle_str = False  # 处理字符串标志 表示正在处理字符串
@@ -181,50 +580,32 @@ class Lexer():
                 j += 1
             if need_split:
                 if i!=j:
-                    tokens.append(src[i:j].strip())
+                    yield i, j
                # print(src[i:j].strip())
             i = j  # 取出一个词后 i从上一次右界出发
-        return tokens
 
     """
-        获得去除注释并去除换行符\n\t的源代码(假设代码无语法错误)
+        获得去除注释后的源代码(假设代码无语法错误)
         注释识别两种：a. // -> \n结束   and  b.  /*----*/结束
+        每个注释替换为一个空格 换行符等空白原样保留 字符串常量中的//和/*不是注释
         @param src_raw 源代码
         @return str 处理后的代码字符串
     """
 
     def get_preprocessed(self, src_raw):
-        src_without_comment = ''
-        raw_len = len(src_raw)  # 原文本的长度
-        del_a = False  # 标志是否正在删除//类注释
-        del_b = False  # 标志是否正在删除/* */类注释
-        for i, ch in enumerate(src_raw):
-            if del_a:
-                # 正在删除 // 类注释 寻找结束标记\n
-                if ch == '\n':
-                    # 遇到\n 结束
-                    del_a = False
-                continue
-            if del_b:
-                # 正在删除 /* 类注释 寻找结束标记*/
-                if i > 0:
-                    if ch == '/' and src_raw[i - 1] == '*':
-                        # 遇到*/结束
-                        del_b = False
-                continue
-            # 没有正在进行删除注释 则寻找注释起始标记/* 或//
-            if i < raw_len - 1 and ch == '/':
-                if src_raw[i + 1] == '/':
-                    # 匹配 //型注释
-                    del_a = True
-                    continue
-                elif src_raw[i + 1] == '*':
-                    # 匹配/*型注释
-                    del_b = True
-                    continue
-            # 没有找到注释标记
-            src_without_comment += ch
-        return src_without_comment.replace('\n', '').replace('\t', '').replace('\r','')
+        return self.preprocess(src_raw)[0]
+
+    """
+        预处理并给出位置映射 线性时间
+        @param src_raw 源代码
+        @return (str 处理后的代码字符串, OffsetMap 处理后位置 -> 原始行列)
+    """
+
+    def preprocess(self, src_raw):
+        offset_map = OffsetMap(src_raw)
+        stripper = CommentStripper(offset_map)
+        src = stripper.feed(src_raw, final=True)
+        return src, offset_map
 
     """
         判断是否是保留字
@@ -233,7 +614,7 @@ class Lexer():
     """
 
     def is_reserved(self, token: str):
-        return token.strip() in Reserved
+        return token.strip() in self.reserved_set
 
     """
         判断是否是操作符
@@ -242,7 +623,7 @@ class Lexer():
     """
 
     def is_operator(self, token: str):
-        return token.strip() in Operator
+        return token.strip() in OperatorSet
 
     """
         判断是否是分隔符
@@ -251,7 +632,7 @@ class Lexer():
     """
 
     def is_delimiter(self, char: str):
-        return char.strip() in Delimiter
+        return char.strip() in DelimiterSet
 
     """
         判断是否是空格
@@ -260,7 +641,7 @@ class Lexer():
     """
 
     def is_space(self, char):
-        return char == ' '
+        return char in Space
 
     """
         判断是否是数字
@@ -397,36 +778,541 @@ class Lexer():
             return False
 
 
+    """
+        流式预处理 逐块产出去除注释后的代码 结果与get_preprocessed一致
+        注释/字符串状态在块之间保持 块末尾的/或*留到下一块再判断
+        @param source 代码字符串或文件对象
+        @param chunk_size 每块字符数
+        @return 生成器 预处理后的代码块
+    """
+
+    def iter_preprocessed(self, source, chunk_size=CHUNK_SIZE):
+        stripper = CommentStripper()
+        for chunk in iter_chunks(source, chunk_size):
+            res = stripper.feed(chunk)
+            if res:
+                yield res
+        res = stripper.finish()
+        if res:
+            yield res
+
+    """
+        流式词法分析 惰性地逐个产出lex 不保存中间结果
+        分词时token右界最多依赖其后一个字符(双字符运算符/浮点数中的.)
+        所以右界距块末尾不足两个字符的token可能被下一块改变(标识符/字符串/运算符跨块) 留到下一块重新分词
+        @param source 代码字符串或文件对象(文本或二进制 按块读取)
+        @param chunk_size 每块字符数
+        @return 生成器 lex
+    """
+
+    def iter_tokens(self, source, chunk_size=CHUNK_SIZE):
+        pending = ''
+        for chunk in self.iter_preprocessed(source, chunk_size):
+            buf = pending + chunk
+            limit = len(buf) - 1
+            start = len(buf)  # 尚未确定的部分的起点
+            for i, j in self.split_spans(buf):
+                if j >= limit:
+                    start = i
+                    break
+                token = buf[i:j].strip()
+                yield lex(token, self.get_token_type(token))
+            pending = buf[start:]
+        for i, j in self.split_spans(pending):
+            token = pending[i:j].strip()
+            yield lex(token, self.get_token_type(token))
+
+    """
+        单遍正则扫描 一次finditer完成去注释/分词/判断类型
+        结果与classic后端一致
+        @param raw 源代码
+        @return 生成器 lex
+    """
+
+    def iter_regex_tokens(self, raw):
+        for type, start, end in self.iter_regex_spans(raw):
+            token = raw[start:end]
+            yield lex(token, self.type_name(type, token))
+
+    """
+        由LexerGenerator生成的最小化DFA驱动扫描 每个字符查一次转移表
+        分词规则与regex后端一致
+        @param raw 源代码
+        @return 生成器 lex
+    """
+
+    def iter_dfa_tokens(self, raw):
+        for type, start, end in self.iter_dfa_spans(raw):
+            token = raw[start:end]
+            yield lex(token, self.type_name(type, token))
+
+    """
+        逐个产出lex 使用当前后端 不保存中间结果 结果与analyze得到的lex_result一致
+        @param source 代码字符串 或utf-8编码的字节串
+        @return 生成器 lex
+    """
+
+    def iter_lex(self, source):
+        if self.backend == 'classic':
+            if isinstance(source, (bytes, bytearray)):
+                # 按块增量解码 不复制出整个字符串
+                source = io.BytesIO(source)
+            return self.iter_tokens(source)
+        if isinstance(source, (bytes, bytearray)):
+            source = source.decode('utf-8')
+        if self.backend == 'regex':
+            return self.iter_regex_tokens(source)
+        return self.iter_dfa_tokens(source)
+
+    def iter_regex_spans(self, raw):
+        for m in MASTER_PATTERN.finditer(raw):
+            kind = m.lastgroup
+            if kind == 'space' or kind == 'comment':
+                continue
+            token = m.group()
+            if kind == 'name':
+                if token in self.reserved_set:
+                    kind = 'reserved'
+                elif token == 'true' or token == 'false':
+                    kind = 'bool'
+            type, length = self.classify_kind(kind, token)
+            yield type, m.start(), m.start() + length
+
+    def iter_dfa_spans(self, raw):
+        dfa = LexerGenerator.get_dfa(self.reserved, Operator, Delimiter)
+        for kind, i, j in dfa.scan(raw):
+            if kind == 'space' or kind == 'comment':
+                continue
+            type, length = self.classify_kind(kind, raw[i:j])
+            yield type, i, i + length
+
+    def iter_classic_spans(self, raw):
+        src, offset_map = self.preprocess(raw)
+        for i, j in self.split_spans(src):
+            piece = src[i:j]
+            token = piece.strip()
+            start = offset_map.to_raw(i + len(piece) - len(piece.lstrip()))
+            type = self.classify(token)
+            if type is None:
+                self.get_token_type(token)
+            yield type, start, start + len(token)
+
+    """
+        扫描器给出的种类 -> TOKEN_TYPE
+        字符串/字符常量及无法直接归类的词 走完整的判断流程(包括报错)
+        @param kind 扫描器给出的种类
+        @param token token文本
+        @return (TOKEN_TYPE, 去掉两端空白后的长度)
+    """
+
+    def classify_kind(self, kind, token):
+        type = KIND_TYPES.get(kind)
+        if type is None:
+            # 未闭合的字符串会延伸到末尾 与split_token一样去掉两端空白
+            token = token.strip()
+            type = self.classify(token)
+            if type is None:
+                self.get_token_type(token)
+        return type, len(token)
+
+    """
+        在utf-8字节缓冲区上扫描 使用dfa后端的转移表 不解码整个输入
+        只有字符串/字符常量等需要进一步判断的token才解码
+        @param buf bytes/mmap/memoryview
+        @return 生成器 (TOKEN_TYPE, 起点, 终点) 位置为字节偏移
+    """
+
+    def iter_byte_spans(self, buf):
+        dfa = LexerGenerator.get_dfa(self.reserved, Operator, Delimiter)
+        for kind, i, j in dfa.scan(buf):
+            if kind == 'space' or kind == 'comment':
+                continue
+            type = KIND_TYPES.get(kind)
+            if type is None:
+                piece = bytes(buf[i:j]).strip()
+                type, length = self.classify_kind(kind, piece.decode('utf-8'))
+                j = i + len(piece)
+            yield type, i, j
+
+    """
+        逐个产出token在原始代码中的位置 使用当前后端
+        @param raw 源代码
+        @return 生成器 (TOKEN_TYPE, 起点, 终点)
+    """
+
+    def iter_spans(self, raw):
+        if self.backend == 'regex':
+            return self.iter_regex_spans(raw)
+        if self.backend == 'dfa':
+            return self.iter_dfa_spans(raw)
+        return self.iter_classic_spans(raw)
+
+    """
+        词法分析 结果按列存入TokenBuffer 不为每个token创建对象 也不复制子串
+        @param raw 源代码
+        @return TokenBuffer
+    """
+
+    def tokenize(self, raw):
+        buffer = TokenBuffer(raw, self.type_name)
+        append = buffer.append
+        line = 1
+        line_start = 0
+        prev = 0
+        for type, start, end in self.iter_spans(raw):
+            # 增量统计上一个token到当前token之间的换行
+            n = raw.count('\n', prev, start)
+            if n:
+                line += n
+                line_start = raw.rfind('\n', prev, start) + 1
+            append(type, start, end - start, line, start - line_start + 1)
+            # token内部的换行(字符串常量中)
+            n = raw.count('\n', start, end)
+            if n:
+                line += n
+                line_start = raw.rfind('\n', start, end) + 1
+            prev = end
+        return buffer
+
+    """
+        词法分析 中间结果与结果保存在本次调用的LexContext中 不修改词法分析器本身
+        同一个Lexer可以同时被多个请求/线程使用
+        @param raw 源代码
+        @return LexContext
+    """
+
+    def analyze(self, raw):
+        ctx = LexContext(raw)
+        times = ctx.times
+        if self.backend == 'regex' or self.backend == 'dfa':
+            # 单遍扫描 去注释/分词/判断类型不再分开
+            with times.phase('scan'):
+                if self.backend == 'regex':
+                    ctx.lex_result = list(self.iter_regex_tokens(raw))
+                else:
+                    ctx.lex_result = list(self.iter_dfa_tokens(raw))
+                ctx.tokens = [item.token for item in ctx.lex_result]
+            return ctx
+        with times.phase('get_preprocessed'):
+            ctx.src_preprocessed, ctx.offset_map = self.preprocess(raw)
+        with times.phase('split_token'):
+            ctx.tokens = self.split_token(ctx.src_preprocessed)
+        with times.phase('get_lex_result'):
+            ctx.lex_result = self.get_lex_result(ctx.tokens)
+        return ctx
+
+    """
+        词法分析 结果同时保存在词法分析器上(src_raw/src_preprocessed/tokens/lex_result/times)
+        并发使用同一个Lexer时应调用analyze
+        @param raw 源代码
+        @return lex_result
+    """
+
     def run(self, raw):
-        self.src_raw = raw
-        self.src_preprocessed = self.get_preprocessed(self.src_raw)
-        self.tokens = self.split_token(self.src_preprocessed)
-        self.lex_result = self.get_lex_result(self.tokens)
+        ctx = self.analyze(raw)
+        self.src_raw = ctx.src_raw
+        self.src_preprocessed = ctx.src_preprocessed
+        if ctx.offset_map is not None:
+            self.offset_map = ctx.offset_map
+        self.tokens = ctx.tokens
+        self.lex_result = ctx.lex_result
+        self.times = ctx.times
         return self.lex_result
 
 
+class LexSession():
+    """
+    增量词法分析会话 供编辑器使用
+    文档修改后 从修改位置之前最近的安全token边界开始重新扫描 新的token起点与旧token流对齐时停止
+    扫描器在token之间不保留状态 且扫描一个token最多越过其结束位置lookahead个字符
+    所以结束位置离修改位置足够远的token不受影响
+    token位置按间隙存储: 下标小于gap的token记录距文本开头的位置 其余记录距文本末尾的位置(负数)
+    除显示用的终点外另记扫描终点: 未闭合的引号等token去掉了末尾空白 但扫描器实际读到了更远处
+    修改位置之后的token不需要逐个平移 移动gap的代价只与两次修改之间的token数有关
+    """
+
+    def __init__(self, lexer, text=''):
+        self.lexer = lexer
+        self.dfa = LexerGenerator.get_dfa(lexer.reserved, Operator, Delimiter)
+        self.lookahead = self.dfa.max_lookahead()  # None表示没有上界 每次都从头扫描
+        self.text = ''
+        self.starts = []
+        self.ends = []
+        self.scan_ends = []  # 扫描器实际读到的位置 判断token是否受修改影响时使用
+        self.types = []  # TOKEN_TYPE 无法识别时为None
+        self.gap = 0
+        self.errors = 0  # 无法识别的token数
+        self.version = 0  # 每次修改加1
+        self.set_text(text)
+
+    def set_text(self, text):
+        """
+        整体替换文档内容 重新扫描
+        :param text: 文档内容
+        :return:
+        """
+        self.text = text
+        self.starts, self.ends, self.scan_ends, self.types = [], [], [], []
+        self.gap = 0
+        self.errors = 0
+        for type, start, end, scan_end in self.scan(0):
+            self.starts.append(start)
+            self.ends.append(end)
+            self.scan_ends.append(scan_end)
+            self.types.append(type)
+            if type is None:
+                self.errors += 1
+        self.gap = len(self.starts)
+        self.version += 1
+
+    def __len__(self):
+        return len(self.starts)
+
+    def scan(self, pos):
+        """
+        从token边界pos开始扫描当前文档
+        :return: 生成器 (TOKEN_TYPE or None, 起点, 终点, 扫描终点)
+        """
+        text = self.text
+        for kind, i, j in self.dfa.scan(text, pos):
+            if kind == 'space' or kind == 'comment':
+                continue
+            type = KIND_TYPES.get(kind)
+            if type is None:
+                token = text[i:j].strip()
+                type = self.lexer.classify(token)
+                yield type, i, i + len(token), j
+            else:
+                yield type, i, j, j
+
+    def span(self, k):
+        """
+        :return: (起点, 终点) 第k个token在当前文档中的位置
+        """
+        if k < self.gap:
+            return self.starts[k], self.ends[k]
+        n = len(self.text)
+        return self.starts[k] + n, self.ends[k] + n
+
+    def move_gap(self, k):
+        """
+        将gap移动到下标k
+        :return:
+        """
+        n = len(self.text)
+        starts, ends, scan_ends = self.starts, self.ends, self.scan_ends
+        for i in range(k, self.gap):
+            starts[i] -= n
+            ends[i] -= n
+            scan_ends[i] -= n
+        for i in range(self.gap, k):
+            starts[i] += n
+            ends[i] += n
+            scan_ends[i] += n
+        self.gap = k
+
+    def find_restart(self, pos):
+        """
+        可以保留的token数 即扫描终点加lookahead不超过pos的token数
+        :param pos: 修改的起点
+        :return: int
+        """
+        if self.lookahead is None:
+            return 0
+        limit = pos - self.lookahead
+        scan_ends = self.scan_ends
+        n = len(self.text)
+        lo, hi = 0, len(self.starts)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if (scan_ends[mid] if mid < self.gap else scan_ends[mid] + n) <= limit:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def edit(self, start, end, text):
+        """
+        将文档中[start, end)替换为text 重新扫描受影响的部分
+        :param start: 修改起点(字符位置)
+        :param end: 修改终点
+        :param text: 新的内容
+        :return: (k, removed, 新token数) 第k个token起的removed个token被替换
+        """
+        assert 0 <= start <= end <= len(self.text), '修改范围[%d, %d)超出文档长度%d' % (start, end, len(self.text))
+        k = self.find_restart(start)
+        self.move_gap(k)
+        restart = self.scan_ends[k - 1] if k > 0 else 0
+        old_n = len(self.starts)
+        self.text = self.text[:start] + text + self.text[end:]
+        n = len(self.text)
+        stable = start + len(text)  # 从这里开始 文档与修改前的[end, ...)相同
+        starts, ends, scan_ends, types = [], [], [], []
+        j = k  # 旧token流中尚未对齐的位置
+        for type, i, e, se in self.scan(restart):
+            if i >= stable:
+                rel = i - n
+                while j < old_n and self.starts[j] < rel:
+                    j += 1
+                if j < old_n and self.starts[j] == rel:
+                    # 对齐 之后的扫描结果与修改前相同
+                    break
+            starts.append(i)
+            ends.append(e)
+            scan_ends.append(se)
+            types.append(type)
+        else:
+            j = old_n
+        self.errors -= self.types[k:j].count(None)
+        self.errors += types.count(None)
+        self.starts[k:j] = starts
+        self.ends[k:j] = ends
+        self.scan_ends[k:j] = scan_ends
+        self.types[k:j] = types
+        self.gap = k + len(starts)
+        self.version += 1
+        return k, j - k, len(starts)
+
+    def lex_result(self, lo=0, hi=None):
+        """
+        [lo, hi)范围内token的词法分析结果
+        无法识别的token类型为None
+        :return: list lex
+        """
+        if hi is None:
+            hi = len(self)
+        res = []
+        for k in range(lo, hi):
+            start, end = self.span(k)
+            token = self.text[start:end]
+            type = self.types[k]
+            if type is not None:
+                type = self.lexer.type_name(type, token)
+            res.append(lex(token, type))
+        return res
+
+
+def iter_chunks(source, chunk_size=CHUNK_SIZE):
+    """
+    将输入按块切分
+    :param source: 字符串 或 文本/二进制文件对象(二进制按utf-8增量解码)
+    :param chunk_size: 每块大小
+    :return: 生成器 str
+    """
+    if isinstance(source, str):
+        for i in range(0, len(source), chunk_size):
+            yield source[i:i + chunk_size]
+        return
+    decoder = None
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            break
+        if isinstance(chunk, (bytes, bytearray)):
+            if decoder is None:
+                decoder = codecs.getincrementaldecoder('utf-8')()
+            chunk = decoder.decode(chunk)
+            if not chunk:
+                continue
+        yield chunk
+    if decoder is not None:
+        tail = decoder.decode(b'', final=True)
+        if tail:
+            yield tail
+
+
+def write_lex_result(lex_result, out=None):
+    """
+    批量输出词法分析结果 格式与逐行print相同
+    :param lex_result: lex的可迭代对象
+    :param out: 文本输出流 默认标准输出
+    :return:
+    """
+    out = out or sys.stdout
+    lines = []
+    for i, item in enumerate(lex_result):
+        lines.append('%s %s\n' % (str(i).ljust(4), item))
+        if len(lines) >= OUTPUT_BATCH:
+            out.write(''.join(lines))
+            lines = []
+    out.write(''.join(lines))
+
+
+def write_lex_mmap(src_file_name, out=None):
+    """
+    内存映射方式词法分析并输出 输入不整体读入内存 token为映射区中的字节偏移
+    输出直接拼接字节 格式与write_lex_result相同
+    :param src_file_name: utf-8编码的源文件
+    :param out: 二进制输出流 默认标准输出
+    :return:
+    """
+    if out is None:
+        sys.stdout.flush()
+        out = sys.stdout.buffer
+    type_names = [str(type).encode('utf-8') if type else b'' for type in TYPE_BY_CODE]
+    lexer = Lexer('dfa')
+    with open(src_file_name, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            view = memoryview(mm)
+            try:
+                lines = []
+                for i, (type, start, end) in enumerate(lexer.iter_byte_spans(mm)):
+                    token = view[start:end].tobytes()
+                    width = len(token)
+                    if not token.isascii():
+                        width = len(token.decode('utf-8'))
+                    lines.append(b'%s %s%s %s\n' % (str(i).encode().ljust(4), token, b' ' * (20 - width),
+                                                    type_names[type.value]))
+                    if len(lines) >= OUTPUT_BATCH:
+                        out.write(b''.join(lines))
+                        lines = []
+                out.write(b''.join(lines))
+                out.flush()
+            finally:
+                view.release()
+
+
 """
     通过脚本方式调用
     命令格式:
-        python Lexer.py src_file_name
+        python Lexer.py [--mmap] [--profile] src_file_name
             src_file_name: 源代码文件名
+            --mmap: 以内存映射方式读取utf-8源文件 适合非常大的输入
+            --profile: 在标准错误中输出各阶段耗时
 """
 
 
 def call_bash():
-    # 命令参数的数量
-    args_num = 1 + 1
-    arguments = sys.argv
-    assert len(arguments) == args_num, '缺少必要的指令参数'
-    src_file_name = arguments[1]
+    arguments = sys.argv[1:]
+    use_mmap = '--mmap' in arguments
+    if use_mmap:
+        arguments.remove('--mmap')
+    profile = '--profile' in arguments
+    if profile:
+        arguments.remove('--profile')
+    assert len(arguments) == 1, '缺少必要的指令参数'
+    src_file_name = arguments[0]
     assert re.search('\.(c|C)$', src_file_name), '源文件%s不是.c类型' % (src_file_name)
     assert os.path.exists(src_file_name), '源文件%s不存在' % (src_file_name)
-    src_raw = ''
-    with open(src_file_name, 'r', encoding='utf-8') as f:
-        src_raw = f.read()
-    lexer = Lexer()
-    for i,item in enumerate(lexer.run(src_raw)):
-        print(str(i).ljust(4),item)
+    times = PhaseTimes()
+    if use_mmap:
+        with times.phase('write_lex_mmap'):
+            write_lex_mmap(src_file_name)
+    else:
+        with times.phase('read'):
+            with open(src_file_name, 'r', encoding='utf-8') as f:
+                src_raw = f.read()
+        lexer = Lexer()
+        lex_result = lexer.run(src_raw)
+        times.merge(lexer.times)
+        with times.phase('write_lex_result'):
+            write_lex_result(lex_result)
+    if profile:
+        # 耗时输出到标准错误 不影响词法分析结果的输出
+        sys.stdout.flush()
+        print(times.format(), file=sys.stderr)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,442 @@
+"""
+ 词法分析器生成器
+ 由token表(保留字/运算符/分界符)和常量规则构造NFA 子集构造得到DFA 再最小化并压缩字符类
+ 扫描时每读入一个字符只查一次转移表 增加保留字或运算符不会使扫描变慢
+ Implemented By Python
+"""
+
+from array import array
+
+# 字母表: ASCII字符为0..127 其余字符统一归为OTHER
+OTHER = 128
+ALPHABET_SIZE = 129
+
+# token种类 按优先级从高到低排列 同样长度的匹配取优先级高的
+KINDS = ('space', 'comment', 'string', 'reserved', 'bool', 'float', 'int', 'name', 'word', 'operator', 'delimiter')
+
+SPACE_CHARS = ' \t\r\n'
+QUOTE_CHARS = '"\''
+DIGITS = '0123456789'
+LETTERS = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ_'
+
+# 已生成的DFA 以token表为键
+_dfa_cache = {}
+
+
+class ClassMap(dict):
+    """
+    字符 -> 字符类 查不到的字符(非ASCII)归为OTHER所在的类
+    """
+
+    def __init__(self, classes):
+        super().__init__((chr(c), classes[c]) for c in range(OTHER))
+        self.other = classes[OTHER]
+
+    def __missing__(self, key):
+        return self.other
+
+
+def char_set(chars):
+    """
+    字符串转换为字母表中的符号集合
+    :param chars: 字符集合
+    :return: frozenset
+    """
+    return frozenset(ord(ch) for ch in chars)
+
+
+def complement(symbols):
+    """
+    符号集合的补集(包括OTHER)
+    :param symbols:
+    :return: frozenset
+    """
+    return frozenset(range(ALPHABET_SIZE)) - symbols
+
+
+class NFA():
+    """
+    不确定有限自动机
+    edges[s] = [(符号集合, 目标状态)]  eps[s] = [目标状态]
+    accept[s] = 种类编号(越小优先级越高)
+    """
+
+    def __init__(self):
+        self.edges = []
+        self.eps = []
+        self.accept = {}
+        self.start = self.new_state()
+
+    def new_state(self):
+        self.edges.append([])
+        self.eps.append([])
+        return len(self.edges) - 1
+
+    def add_edge(self, a, symbols, b):
+        self.edges[a].append((symbols, b))
+
+    def add_rule(self):
+        """
+        新增一条规则 返回其起始状态
+        :return: int
+        """
+        s = self.new_state()
+        self.eps[self.start].append(s)
+        return s
+
+    def add_literal(self, text, kind):
+        """
+        新增一个字面量规则 如保留字/运算符
+        :param text: 字面量
+        :param kind: 种类
+        :return:
+        """
+        s = self.add_rule()
+        for ch in text:
+            t = self.new_state()
+            self.add_edge(s, char_set(ch), t)
+            s = t
+        self.set_accept(s, kind)
+
+    def set_accept(self, s, kind):
+        k = KINDS.index(kind)
+        if s not in self.accept or self.accept[s] > k:
+            self.accept[s] = k
+
+    def closure(self, states):
+        """
+        求epsilon闭包
+        :param states: 状态集合
+        :return: frozenset
+        """
+        stack = list(states)
+        res = set(states)
+        while stack:
+            s = stack.pop()
+            for t in self.eps[s]:
+                if t not in res:
+                    res.add(t)
+                    stack.append(t)
+        return frozenset(res)
+
+
+def build_nfa(reserved, operators, delimiters, bools=('true', 'false')):
+    """
+    由token表和常量规则构造NFA
+    分词规则与Lexer的regex后端一致
+    :param reserved: 保留字列表
+    :param operators: 运算符列表
+    :param delimiters: 分界符列表
+    :param bools: 布尔常量
+    :return: NFA
+    """
+    nfa = NFA()
+    op_chars = set(''.join(operators))
+    delimiter_chars = set(d for d in delimiters if len(d) == 1)
+    stop = char_set(SPACE_CHARS + QUOTE_CHARS + ''.join(op_chars | delimiter_chars))
+    digit = char_set(DIGITS)
+    dot = char_set('.')
+    word = complement(stop | dot)  # 组成词的普通字符
+    word_non_digit = word - digit
+
+    # 空白
+    s = nfa.add_rule()
+    a = nfa.new_state()
+    nfa.add_edge(s, char_set(SPACE_CHARS), a)
+    nfa.add_edge(a, char_set(SPACE_CHARS), a)
+    nfa.set_accept(a, 'space')
+
+    # //注释 到行末
+    s = nfa.add_rule()
+    a, b = nfa.new_state(), nfa.new_state()
+    nfa.add_edge(s, char_set('/'), a)
+    nfa.add_edge(a, char_set('/'), b)
+    nfa.add_edge(b, complement(char_set('\n')), b)
+    nfa.set_accept(b, 'comment')
+    # /*注释 开始标记中的*也参与匹配结束标记*/ 未闭合时延伸到末尾
+    s = nfa.add_rule()
+    a, star, body, end = nfa.new_state(), nfa.new_state(), nfa.new_state(), nfa.new_state()
+    nfa.add_edge(s, char_set('/'), a)
+    nfa.add_edge(a, char_set('*'), star)
+    nfa.add_edge(star, char_set('*'), star)
+    nfa.add_edge(star, char_set('/'), end)
+    nfa.add_edge(star, complement(char_set('*/')), body)
+    nfa.add_edge(body, char_set('*'), star)
+    nfa.add_edge(body, complement(char_set('*')), body)
+    for t in (star, body, end):
+        nfa.set_accept(t, 'comment')
+
+    # 字符串/字符常量 从引号到下一个引号 未闭合时延伸到末尾
+    s = nfa.add_rule()
+    body, end = nfa.new_state(), nfa.new_state()
+    quote = char_set(QUOTE_CHARS)
+    nfa.add_edge(s, quote, body)
+    nfa.add_edge(body, complement(quote), body)
+    nfa.add_edge(body, quote, end)
+    nfa.set_accept(body, 'string')
+    nfa.set_accept(end, 'string')
+
+    # 保留字 布尔常量
+    for text in reserved:
+        nfa.add_literal(text, 'reserved')
+    for text in bools:
+        nfa.add_literal(text, 'bool')
+
+    # 浮点数 [0-9]+.[0-9]* | .[0-9]+
+    s = nfa.add_rule()
+    a, b, c = nfa.new_state(), nfa.new_state(), nfa.new_state()
+    nfa.add_edge(s, digit, a)
+    nfa.add_edge(a, digit, a)
+    nfa.add_edge(a, dot, b)
+    nfa.add_edge(b, digit, b)
+    nfa.set_accept(b, 'float')
+    nfa.add_edge(s, dot, c)
+    nfa.add_edge(c, digit, b)
+
+    # 整数 0 | [1-9][0-9]*
+    s = nfa.add_rule()
+    a, b = nfa.new_state(), nfa.new_state()
+    nfa.add_edge(s, char_set('0'), a)
+    nfa.add_edge(s, char_set(DIGITS[1:]), b)
+    nfa.add_edge(b, digit, b)
+    nfa.set_accept(a, 'int')
+    nfa.set_accept(b, 'int')
+
+    # 标识符
+    s = nfa.add_rule()
+    a = nfa.new_state()
+    nfa.add_edge(s, char_set(LETTERS), a)
+    nfa.add_edge(a, char_set(LETTERS + DIGITS), a)
+    nfa.set_accept(a, 'name')
+
+    # 其余的词 与数字相邻的.不断开
+    # after_digit: 上一个字符是数字  after_other: 上一个字符是其他字符  after_dot: 数字后的.
+    # pending_dot: 不在数字后的. 只有后面跟数字才能延续
+    s = nfa.add_rule()
+    after_digit, after_other, after_dot, pending_dot = (nfa.new_state() for i in range(4))
+    nfa.add_edge(s, digit, after_digit)
+    nfa.add_edge(s, word_non_digit, after_other)
+    nfa.add_edge(s, dot, pending_dot)
+    for t in (after_digit, after_other, after_dot):
+        nfa.add_edge(t, digit, after_digit)
+        nfa.add_edge(t, word_non_digit, after_other)
+        nfa.set_accept(t, 'word')
+    nfa.add_edge(after_digit, dot, after_dot)
+    nfa.add_edge(after_other, dot, pending_dot)
+    nfa.add_edge(after_dot, dot, pending_dot)
+    nfa.add_edge(pending_dot, digit, after_digit)
+
+    # 运算符 分界符
+    for text in operators:
+        nfa.add_literal(text, 'operator')
+    for text in delimiters:
+        if len(text) == 1 and text not in QUOTE_CHARS and text not in operators:
+            nfa.add_literal(text, 'delimiter')
+    return nfa
+
+
+class DFA():
+    """
+    压缩后的DFA转移表
+    classes[c] 为字母表符号c所属的字符类
+    table[state * n_classes + cls] 为转移目标 -1表示无转移
+    accept[state] 为接受的token种类编号 -1表示非接受状态
+    """
+
+    def __init__(self, classes, n_classes, table, accept, start=0):
+        self.classes = classes
+        self.n_classes = n_classes
+        self.table = table
+        self.accept = accept
+        self.start = start
+        self.class_of = ClassMap(classes)  # 字符 -> 字符类
+        # utf-8字节 -> 字符类 多字节字符的每个字节都不小于0x80 均归为OTHER 分词结果与按字符扫描一致
+        self.byte_classes = [classes[c] if c < OTHER else classes[OTHER] for c in range(256)]
+
+    def n_states(self):
+        return len(self.accept)
+
+    def max_lookahead(self):
+        """
+        扫描一个token时最多越过其结束位置读入的字符数(上界)
+        最后一次接受之后 只会经过非接受状态 再读入一个使转移失败的字符
+        :return: int 非接受状态之间有环时为None(越过的长度没有上界)
+        """
+        n = self.n_states()
+        n_classes = self.n_classes
+        longest = {}  # 非接受状态 -> 从它出发只经过非接受状态的最长路径上的状态数
+
+        def visit(state, path):
+            if state in longest:
+                return longest[state]
+            if state in path:
+                return None
+            path.add(state)
+            best = 0
+            for cls in range(n_classes):
+                target = self.table[state * n_classes + cls]
+                if target >= 0 and self.accept[target] < 0:
+                    res = visit(target, path)
+                    if res is None:
+                        return None
+                    best = max(best, res)
+            path.discard(state)
+            longest[state] = best + 1
+            return best + 1
+
+        res = 0
+        for state in range(n):
+            if self.accept[state] < 0:
+                length = visit(state, set())
+                if length is None:
+                    return None
+                res = max(res, length)
+        return res + 1
+
+    def scan(self, src, start=0):
+        """
+        最长匹配扫描
+        :param src: 源代码 str 或utf-8字节缓冲区(bytes/mmap/memoryview)
+        :param start: 开始扫描的位置 必须是上一次扫描的token边界
+        :return: 生成器 (种类, 起始位置, 结束位置) 位置为字符/字节偏移 无法匹配时种类为None 长度为1
+        """
+        table = self.table
+        accept = self.accept
+        n_classes = self.n_classes
+        if isinstance(src, str):
+            class_of = self.class_of.__getitem__
+        else:
+            class_of = self.byte_classes.__getitem__
+        length = len(src)
+        i = start
+        while i < length:
+            state = self.start
+            last_kind = -1
+            last_end = i
+            j = i
+            while j < length:
+                state = table[state * n_classes + class_of(src[j])]
+                if state < 0:
+                    break
+                j += 1
+                if accept[state] >= 0:
+                    last_kind = accept[state]
+                    last_end = j
+            if last_kind < 0:
+                yield None, i, i + 1
+                i += 1
+            else:
+                yield KINDS[last_kind], i, last_end
+                i = last_end
+
+
+def subset_construction(nfa: NFA):
+    """
+    子集构造 NFA -> DFA(未压缩 每个状态对全部字母表符号给出转移)
+    :return: (转移表 list[list], 接受种类 list)
+    """
+    start = nfa.closure([nfa.start])
+    index = {start: 0}
+    states = [start]
+    rows = []
+    accept = []
+    k = 0
+    while k < len(states):
+        current = states[k]
+        k += 1
+        targets = [set() for c in range(ALPHABET_SIZE)]
+        for s in current:
+            for symbols, t in nfa.edges[s]:
+                for c in symbols:
+                    targets[c].add(t)
+        row = []
+        for c in range(ALPHABET_SIZE):
+            if not targets[c]:
+                row.append(-1)
+                continue
+            target = nfa.closure(targets[c])
+            if target not in index:
+                index[target] = len(states)
+                states.append(target)
+            row.append(index[target])
+        rows.append(row)
+        kinds = [nfa.accept[s] for s in current if s in nfa.accept]
+        accept.append(min(kinds) if kinds else -1)
+    return rows, accept
+
+
+def minimize(rows, accept):
+    """
+    Moore算法最小化DFA 初始按接受种类划分 反复按转移目标所在的块细分
+    :return: (转移表, 接受种类) 起始状态仍为0
+    """
+    block = list(accept)
+    n_blocks = len(set(block))
+    while True:
+        signatures = {}
+        new_block = []
+        for s, row in enumerate(rows):
+            sig = (block[s], tuple(block[t] if t >= 0 else None for t in row))
+            if sig not in signatures:
+                signatures[sig] = len(signatures)
+            new_block.append(signatures[sig])
+        block = new_block
+        if len(signatures) == n_blocks:
+            break
+        n_blocks = len(signatures)
+    # 重新编号 保证起始状态为0
+    order = {}
+    for s in range(len(rows)):
+        if block[s] not in order:
+            order[block[s]] = len(order)
+    new_rows = [None] * len(order)
+    new_accept = [-1] * len(order)
+    for s, row in enumerate(rows):
+        b = order[block[s]]
+        if new_rows[b] is None:
+            new_rows[b] = [order[block[t]] if t >= 0 else -1 for t in row]
+            new_accept[b] = accept[s]
+    return new_rows, new_accept
+
+
+def compress(rows, accept):
+    """
+    把转移表中各列完全相同的符号合并为一个字符类
+    :return: DFA
+    """
+    columns = {}
+    classes = []
+    for c in range(ALPHABET_SIZE):
+        column = tuple(row[c] for row in rows)
+        if column not in columns:
+            columns[column] = len(columns)
+        classes.append(columns[column])
+    n_classes = len(columns)
+    table = array('i', [-1]) * (len(rows) * n_classes)
+    for column, cls in columns.items():
+        for s, t in enumerate(column):
+            table[s * n_classes + cls] = t
+    return DFA(classes, n_classes, table, array('b', accept))
+
+
+def build_dfa(reserved, operators, delimiters, bools=('true', 'false')):
+    """
+    生成最小化并压缩的DFA
+    :return: DFA
+    """
+    rows, accept = subset_construction(build_nfa(reserved, operators, delimiters, bools))
+    rows, accept = minimize(rows, accept)
+    return compress(rows, accept)
+
+
+def get_dfa(reserved, operators, delimiters, bools=('true', 'false')):
+    """
+    获取DFA 同一组token表只生成一次
+    :return: DFA
+    """
+    key = (tuple(reserved), tuple(operators), tuple(delimiters), tuple(bools))
+    dfa = _dfa_cache.get(key)
+    if dfa is None:
+        dfa = build_dfa(reserved, operators, delimiters, bools)
+        _dfa_cache[key] = dfa
+    return dfa
@@ -0,0 +1,159 @@
+"""
+ Web服务的监控指标 Prometheus文本格式
+ 指标存放在一块double数组中 每个工作进程写自己的槽位 不加锁
+ 多进程服务时这块内存在fork之前以共享内存创建 任一进程输出/metrics时把所有槽位相加
+ 槽位在工作进程重启后由新进程继续使用 计数器不会变小
+ Implemented By Python
+"""
+
+import mmap
+from bisect import bisect_left
+
+# 请求耗时的桶(秒)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 请求体大小的桶(字节)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+# 每个接口占用的位置
+REQUESTS = 0
+ERRORS = 1
+TOKENS = 2
+IN_FLIGHT = 3
+LATENCY = 4  # 各桶计数(最后一个为+Inf) 之后是总和
+SIZE = LATENCY + len(LATENCY_BUCKETS) + 2
+BLOCK = SIZE + len(SIZE_BUCKETS) + 2
+
+
+class Metrics():
+    """
+    按接口统计: 请求数/出错数/token数/正在处理的请求数/耗时直方图/请求体大小直方图
+    """
+
+    def __init__(self, endpoints, prefix='pycompiler'):
+        """
+        :param endpoints: 接口名列表 不在其中的接口统计到最后一个
+        :param prefix: 指标名前缀
+        """
+        self.endpoints = list(endpoints)
+        self.index = {name: k for k, name in enumerate(self.endpoints)}
+        self.prefix = prefix
+        self.slot_size = BLOCK * len(self.endpoints)
+        self.slots = 1
+        self.base = 0  # 当前进程槽位的起点
+        self.buffer = bytearray(8 * self.slot_size)
+        self.values = memoryview(self.buffer).cast('d')
+
+    def share(self, slots):
+        """
+        改为多进程共享的内存 在fork工作进程之前调用 已有的数据保留在第0个槽位
+        :param slots: 槽位数 不少于同时存活的工作进程数
+        :return:
+        """
+        buffer = mmap.mmap(-1, 8 * self.slot_size * slots)
+        values = memoryview(buffer).cast('d')
+        values[:self.slot_size] = self.values[:self.slot_size]
+        self.values.release()
+        self.buffer = buffer
+        self.values = values
+        self.slots = slots
+
+    def use_slot(self, slot):
+        """
+        工作进程fork之后调用 之后的记录都写入该槽位
+        """
+        self.base = slot * self.slot_size
+
+    def reset_gauges(self, slot):
+        """
+        工作进程退出后由主进程调用 清除它未完成的请求数
+        """
+        values = self.values
+        for k in range(len(self.endpoints)):
+            values[slot * self.slot_size + k * BLOCK + IN_FLIGHT] = 0
+
+    def endpoint_base(self, endpoint):
+        return self.base + BLOCK * self.index.get(endpoint, len(self.endpoints) - 1)
+
+    def begin(self, endpoint):
+        """
+        请求开始
+        :return: int 传给end
+        """
+        base = self.endpoint_base(endpoint)
+        self.values[base + IN_FLIGHT] += 1
+        return base
+
+    def end(self, base, seconds, size, error=False):
+        """
+        请求结束
+        :param base: begin的返回值
+        :param seconds: 耗时
+        :param size: 请求体字节数
+        :param error: 是否出错
+        """
+        values = self.values
+        values[base + IN_FLIGHT] -= 1
+        values[base + REQUESTS] += 1
+        if error:
+            values[base + ERRORS] += 1
+        values[base + LATENCY + bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        values[base + SIZE - 1] += seconds
+        values[base + SIZE + bisect_left(SIZE_BUCKETS, size)] += 1
+        values[base + BLOCK - 1] += size
+
+    def add_tokens(self, endpoint, n):
+        self.values[self.endpoint_base(endpoint) + TOKENS] += n
+
+    def totals(self):
+        """
+        所有槽位相加
+        :return: list 每个接口一段 布局与单个槽位相同
+        """
+        values = self.values
+        size = self.slot_size
+        res = list(values[:size])
+        for slot in range(1, self.slots):
+            base = slot * size
+            for i in range(size):
+                res[i] += values[base + i]
+        return res
+
+    def render(self):
+        """
+        Prometheus文本格式
+        :return: str
+        """
+        totals = self.totals()
+        prefix = self.prefix
+        lines = []
+
+        def labels(endpoint):
+            return 'endpoint="%s"' % endpoint.replace('\\', '\\\\').replace('"', '\\"')
+
+        for name, kind, offset, doc in (('requests_total', 'counter', REQUESTS, '请求数'),
+                                        ('errors_total', 'counter', ERRORS, '出错或分析失败的请求数'),
+                                        ('tokens_total', 'counter', TOKENS, '词法分析得到的token数'),
+                                        ('requests_in_flight', 'gauge', IN_FLIGHT, '正在处理的请求数')):
+            lines += ['# HELP %s_%s %s' % (prefix, name, doc), '# TYPE %s_%s %s' % (prefix, name, kind)]
+            for k, endpoint in enumerate(self.endpoints):
+                lines.append('%s_%s{%s} %s' % (prefix, name, labels(endpoint), format_value(totals[k * BLOCK + offset])))
+        for name, offset, bounds, doc in (('request_duration_seconds', LATENCY, LATENCY_BUCKETS, '请求耗时(到响应头发出为止)'),
+                                          ('request_size_bytes', SIZE, SIZE_BUCKETS, '请求体大小')):
+            name = '%s_%s' % (prefix, name)
+            lines += ['# HELP %s %s' % (name, doc), '# TYPE %s histogram' % name]
+            for k, endpoint in enumerate(self.endpoints):
+                base = k * BLOCK + offset
+                label = labels(endpoint)
+                count = 0
+                for i, bound in enumerate(bounds + ('+Inf',)):
+                    count += totals[base + i]
+                    lines.append('%s_bucket{%s,le="%s"} %s' % (name, label, bound, format_value(count)))
+                lines.append('%s_sum{%s} %s' % (name, label, format_value(totals[base + len(bounds) + 1])))
+                lines.append('%s_count{%s} %s' % (name, label, format_value(count)))
+        return '\n'.join(lines) + '\n'
+
+
+def format_value(v):
+    if v == int(v):
+        return str(int(v))
+    return repr(v)
@@ -0,0 +1,348 @@
+"""
+ 语法分析器生成器
+ 由编译好的LL(1)文法生成独立的Python语法分析模块
+ 每个非终结符生成一个函数 select集作为常量写入模块 导入后无需再做文法分析
+ 生成的函数之间不直接调用 而是返回下一个要执行的函数由主循环执行
+ 产生式中间的非终结符: 把右部剩余部分对应的续接函数压入显式栈 再返回该非终结符的函数
+ 产生式最后的非终结符: 直接返回该非终结符的函数 不压栈
+ 因此任意深度的嵌套都不会加深Python调用栈
+ Implemented By Python
+"""
+
+import os
+import sys
+import time
+import tempfile
+import threading
+import importlib.util
+import GrammarCompiler
+
+# 生成代码格式版本 生成的代码结构发生变化时递增 旧版本模块自动失效
+GENERATOR_VERSION = 2
+
+# 进程内缓存 文法哈希 -> 已导入的模块
+_loaded = {}
+# 生成/导入模块时加锁 多个线程共用一个Syntaxer时只生成一次
+_lock = threading.Lock()
+# 模块开头多少行内应有版本与文法哈希
+HEADER_LINES = 16
+
+
+def function_name(syntaxer, vn):
+    """
+    非终结符对应的函数名 非终结符可能含有'等字符 统一使用编号
+    :return: str
+    """
+    return 'nt_%d' % syntaxer.dense_table.ids[vn]
+
+
+def select_ids(syntaxer, pid):
+    """
+    产生式的select集 终结符编号形式
+    :param pid: 产生式编号
+    :return: list
+    """
+    table = syntaxer.dense_table
+    row = (table.ids[table.lhs[pid]] - table.n_vt) * table.n_vt
+    return [j for j in range(table.n_vt) if table.table[row + j] == pid]
+
+
+def generate_source(syntaxer):
+    """
+    生成语法分析模块的源代码
+    :param syntaxer: 已加载文法的Syntaxer
+    :return: str
+    """
+    syntaxer.load_grammar()
+    table = syntaxer.dense_table
+    ids = table.ids
+    n_vt = table.n_vt
+    lines = [
+        '"""',
+        ' 由ParserGenerator根据%s生成的LL(1)语法分析器 请勿手动修改' % syntaxer.config_path,
+        ' parse_ids(work, unknown) 输入终结符编号串(以#的编号结尾) 返回(是否匹配, 汇总信息)',
+        ' 结果与Syntaxer.driver一致',
+        '"""',
+        '',
+        'GENERATOR_VERSION = %d' % GENERATOR_VERSION,
+        'GRAMMAR_DIGEST = %r' % syntaxer.grammar_digest,
+        'SYMBOLS = %r' % (tuple(table.symbols),),
+        'IDS = {v: i for i, v in enumerate(SYMBOLS)}',
+        'N_VT = %d' % n_vt,
+        'END = %d' % ids['#'],
+        'START = %r' % syntaxer.start_v,
+        '',
+        '# select集 含多个终结符时使用frozenset 只有一个终结符时在分支中直接比较',
+    ]
+    for pid in range(len(table.rhs)):
+        selects = select_ids(syntaxer, pid)
+        if len(selects) > 1:
+            lines.append('S_%d = frozenset(%r)  # %s→%s' % (pid, tuple(selects), table.lhs[pid], ' '.join(table.rhs[pid])))
+    lines += [
+        '',
+        '',
+        'class ParseFailed(Exception):',
+        '    """',
+        '    匹配失败 用于从嵌套的调用中直接退出',
+        '    """',
+        '    pass',
+        '',
+        '',
+        'def parse_ids(work, unknown=None):',
+        '    """',
+        '    LL(1)分析',
+        '    :param work: 终结符编号串 未知符号为-1',
+        '    :param unknown: 位置 -> 未知符号 用于报错',
+        '    :return: (bool, dict) 是否匹配, 步数/展开次数/匹配符号数',
+        '    """',
+        '    p = 0',
+        '    v = work[0]',
+        '    expands = 0',
+        '    stack = []  # 待执行的续接函数',
+        '    push = stack.append',
+        '    pop = stack.pop',
+        '',
+        '    def fail():',
+        '        if v < 0:',
+        '            raise Exception("遇到未知的符号: %s" % (unknown or {}).get(p, v))',
+        '        raise ParseFailed()',
+    ]
+    continuations = []  # (产生式编号, 右部下标)
+
+    def emit_symbols(pid, symbols, start, pad):
+        """
+        生成从右部第start个符号开始的匹配代码 遇到中间的非终结符时压入续接函数并返回
+        :param pad: 缩进
+        """
+        for k in range(start, len(symbols)):
+            symbol = symbols[k]
+            v_id = ids[symbol]
+            if v_id < n_vt:
+                if k > 0:
+                    # 右部以终结符开头时 select集就是该终结符 分支条件已经比较过
+                    lines.extend([
+                        pad + 'if v != %d:  # %s' % (v_id, symbol),
+                        pad + '    fail()',
+                    ])
+                lines.extend([
+                    pad + 'p += 1',
+                    pad + 'v = work[p]',
+                ])
+            elif k == len(symbols) - 1:
+                lines.append(pad + 'return %s' % function_name(syntaxer, symbol))
+                return
+            else:
+                continuations.append((pid, k + 1))
+                lines.extend([
+                    pad + 'push(c_%d_%d)' % (pid, k + 1),
+                    pad + 'return %s' % function_name(syntaxer, symbol),
+                ])
+                return
+        lines.append(pad + 'return None')
+
+    for vn in syntaxer.vn:
+        lines += ['', '    def %s():' % function_name(syntaxer, vn)]
+        pids = [pid for pid in range(len(table.lhs)) if table.lhs[pid] == vn]
+        for pid in pids:
+            lines.append('        # %s→%s' % (vn, ' '.join(table.rhs[pid])))
+        lines.append('        nonlocal p, v, expands')
+        keyword = 'if'
+        for pid in pids:
+            selects = select_ids(syntaxer, pid)
+            if not selects:
+                continue
+            if len(selects) == 1:
+                lines.append('        %s v == %d:' % (keyword, selects[0]))
+            else:
+                lines.append('        %s v in S_%d:' % (keyword, pid))
+            keyword = 'elif'
+            lines.append('            expands += 1')
+            emit_symbols(pid, [table.symbols[i] for i in reversed(table.rhs_rev[pid])], 0, ' ' * 12)
+        lines.append('        fail()')
+    # 续接函数: 右部中间的非终结符匹配完成后 从其后的符号继续
+    k = 0
+    while k < len(continuations):
+        pid, start = continuations[k]
+        symbols = [table.symbols[i] for i in reversed(table.rhs_rev[pid])]
+        lines += [
+            '',
+            '    def c_%d_%d():' % (pid, start),
+            '        # %s→%s · %s' % (table.lhs[pid], ' '.join(symbols[:start]), ' '.join(symbols[start:])),
+            '        nonlocal p, v',
+        ]
+        emit_symbols(pid, symbols, start, ' ' * 8)
+        k += 1
+    lines += [
+        '',
+        '    try:',
+        '        f = %s' % function_name(syntaxer, syntaxer.start_v),
+        '        while True:',
+        '            while f is not None:',
+        '                f = f()',
+        '            if not stack:',
+        '                break',
+        '            f = pop()',
+        '        is_match = v == END',
+        '    except ParseFailed:',
+        '        is_match = False',
+        "    return is_match, {'steps': expands + p, 'expands': expands, 'matches': p}",
+        '',
+        '',
+        'def parse(analysis):',
+        '    """',
+        '    LL(1)分析',
+        '    :param analysis: 终结符串 以#结尾',
+        '    :return: (bool, dict)',
+        '    """',
+        '    work = []',
+        '    unknown = {}',
+        '    for k, v in enumerate(analysis):',
+        '        v_id = IDS.get(v, -1)',
+        '        if v_id >= N_VT:',
+        '            v_id = -1',
+        '        if v_id < 0:',
+        '            unknown[k] = v',
+        '        work.append(v_id)',
+        '    return parse_ids(work, unknown)',
+        '',
+    ]
+    return '\n'.join(lines)
+
+
+def parser_path(syntaxer):
+    """
+    生成的模块在缓存目录中的路径 与文法产物放在一起
+    :return: str
+    """
+    path = GrammarCompiler.artifact_path(syntaxer.config_path, syntaxer.grammar_digest)
+    return '%s.parser_v%d.py' % (os.path.splitext(path)[0], GENERATOR_VERSION)
+
+
+def write_parser(syntaxer, path):
+    """
+    生成语法分析模块并写入文件 先写临时文件再替换
+    :param path: 输出文件路径
+    :return:
+    """
+    source = generate_source(syntaxer)
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(source)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def header_matches(path, digest):
+    """
+    不执行模块 只读取开头几行 检查生成器版本与文法哈希
+    :return: bool
+    """
+    expected = {'GENERATOR_VERSION = %d' % GENERATOR_VERSION, 'GRAMMAR_DIGEST = %r' % digest}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for _ in range(HEADER_LINES):
+                expected.discard(f.readline().rstrip('\n'))
+    except (OSError, UnicodeDecodeError):
+        return False
+    return not expected
+
+
+def import_parser(path):
+    """
+    按文件路径导入生成的模块
+    :return: module
+    """
+    name = os.path.splitext(os.path.basename(path))[0].replace('.', '_')
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_parser(syntaxer):
+    """
+    获取当前文法对应的生成模块
+    同一文法在进程内只导入一次 缓存目录中没有或已过期时重新生成
+    缓存的文件在导入前先检查开头的版本与文法哈希 过期或不相符的文件不会被执行
+    :param syntaxer: Syntaxer
+    :return: module
+    """
+    syntaxer.load_grammar()
+    digest = syntaxer.grammar_digest
+    module = _loaded.get(digest)
+    if module is not None:
+        return module
+    with _lock:
+        module = _loaded.get(digest)
+        if module is None:
+            path = parser_path(syntaxer)
+            if not header_matches(path, digest):
+                write_parser(syntaxer, path)
+            module = import_parser(path)
+            _loaded[digest] = module
+    return module
+
+
+def benchmark(syntaxer, code_raw, repeat=5):
+    """
+    对比各分析驱动程序的耗时 只计分析本身 不含词法分析
+    :param code_raw: 代码段
+    :param repeat: 重复次数 取最小值
+    :return: dict 驱动程序 -> 秒
+    """
+    from Syntaxer import TRACE_OFF
+    parser = load_parser(syntaxer)
+    analysis = syntaxer.get_tokens(code_raw)
+    work, unknown = syntaxer.get_token_ids(code_raw)
+    cases = {
+        'stack': lambda: syntaxer.driver(analysis, TRACE_OFF),
+        'fast': lambda: syntaxer.fast_driver(work, unknown, TRACE_OFF),
+        'generated': lambda: parser.parse_ids(work, unknown),
+    }
+    res = {}
+    for name, fn in cases.items():
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            cost = time.perf_counter() - start
+            if best is None or cost < best:
+                best = cost
+        res[name] = best
+    return res
+
+
+"""
+    通过脚本方式调用
+    命令格式:
+        python ParserGenerator.py [config_path] [out_path]
+            生成语法分析模块 默认输出到缓存目录
+        python ParserGenerator.py --bench src_file_name [config_path]
+            对比各分析驱动程序的耗时
+"""
+
+
+if __name__ == '__main__':
+    from Syntaxer import Syntaxer
+    arguments = sys.argv[1:]
+    if arguments and arguments[0] == '--bench':
+        assert len(arguments) >= 2, '缺少必要的指令参数'
+        config_path = arguments[2] if len(arguments) > 2 else 'config/simple_c_grammar.xml'
+        syntaxer = Syntaxer(config_path=config_path)
+        with open(arguments[1], 'r', encoding='utf-8') as f:
+            code_raw = f.read()
+        for name, cost in benchmark(syntaxer, code_raw).items():
+            print('[ParserGenerator]: %s %.3fms' % (name.ljust(10), cost * 1000))
+    else:
+        config_path = arguments[0] if arguments else 'config/simple_c_grammar.xml'
+        syntaxer = Syntaxer(config_path=config_path)
+        syntaxer.load_grammar()
+        out_path = arguments[1] if len(arguments) > 1 else parser_path(syntaxer)
+        write_parser(syntaxer, out_path)
+        print('[ParserGenerator]: %s -> %s' % (config_path, out_path))
@@ -0,0 +1,83 @@
+"""
+ 分阶段计时
+ 每次分析的上下文带有一个PhaseTimes 各阶段用perf_counter_ns计时 开销只有两次计时调用
+ Implemented By Python
+"""
+
+from time import perf_counter_ns
+
+
+class Phase():
+    """
+    with times.phase(name): 计时一个阶段
+    """
+    __slots__ = ('times', 'name', 'start')
+
+    def __init__(self, times, name):
+        self.times = times
+        self.name = name
+        self.start = 0
+
+    def __enter__(self):
+        # 先占位 外层阶段排在其中嵌套的阶段之前
+        self.times.ns.setdefault(self.name, 0)
+        self.start = perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.times.add(self.name, perf_counter_ns() - self.start)
+        return False
+
+
+class PhaseTimes():
+    """
+    各阶段耗时(纳秒) 同名阶段多次出现时累加 按首次出现的顺序排列
+    阶段可以嵌套(例如load_grammar中的read_conf) 嵌套的阶段同时计入外层
+    """
+    __slots__ = ('ns',)
+
+    def __init__(self):
+        self.ns = {}
+
+    def phase(self, name):
+        return Phase(self, name)
+
+    def add(self, name, ns):
+        self.ns[name] = self.ns.get(name, 0) + ns
+
+    def merge(self, other, prefix=''):
+        """
+        合并另一组耗时
+        :param other: PhaseTimes
+        :param prefix: 阶段名前缀 例如'lex.'
+        :return:
+        """
+        for name, ns in other.ns.items():
+            self.add(prefix + name, ns)
+
+    def __bool__(self):
+        return bool(self.ns)
+
+    def __iter__(self):
+        return iter(self.ns.items())
+
+    def as_dict(self):
+        """
+        :return: dict 阶段 -> 毫秒
+        """
+        return {name: ns / 1e6 for name, ns in self.ns.items()}
+
+    def format(self, head='[Profile]: '):
+        """
+        可读的耗时表
+        :return: str
+        """
+        width = max([len(name) for name in self.ns] + [8])
+        return '\n'.join('%s%s %10.3fms' % (head, name.ljust(width), ns / 1e6) for name, ns in self.ns.items())
+
+    def server_timing(self):
+        """
+        Server-Timing响应头的值
+        :return: str
+        """
+        return ', '.join('%s;dur=%.3f' % (name, ns / 1e6) for name, ns in self.ns.items())
@@ -2,81 +2,823 @@
     PyCompiler
     Web服务接口
 """
+import os
 import sys
-from Lexer import Lexer
-from Syntaxer import Syntaxer
-from flask import Flask, request, make_response,jsonify
+import time
+import signal
+import socket
+import random
+import argparse
+import json
+import hashlib
+import uuid
+import threading
+import traceback
+from time import perf_counter_ns
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, wait
+from Lexer import Lexer, LexSession, Operator, Delimiter, TYPE_BY_CODE
+import LexerGenerator
+import LexWire
+from Profiler import PhaseTimes
+from Metrics import Metrics
+from Syntaxer import Syntaxer, TRACE_OFF, ENGINE_FAST
+from flask import Flask, Response, request, make_response,jsonify, g
+from werkzeug.exceptions import RequestEntityTooLarge
+import gevent
 from gevent.pywsgi import WSGIServer
 app = Flask(__name__)
+# 请求体大小上限(字节)
+MAX_BODY_BYTES = int(os.environ.get('PYCOMPILER_MAX_BODY_BYTES', 16 * 1024 * 1024))
+app.config['MAX_CONTENT_LENGTH'] = MAX_BODY_BYTES
+# 请求体即为utf-8编码源代码的类型
+RAW_TYPES = ('text/plain', 'application/octet-stream')
+# 流式词法分析结果的类型 每行一个JSON
+NDJSON_TYPE = 'application/x-ndjson'
+# 流式输出时每行包含的token数
+STREAM_BATCH = int(os.environ.get('PYCOMPILER_STREAM_BATCH', 1024))
+# /getLex可协商的结果类型 第一个为默认
+LEX_TYPES = ['application/json', NDJSON_TYPE, LexWire.MIME_TYPE]
+# 二进制格式中的类型名 与JSON结果中的Type一致
+WIRE_TYPE_NAMES = [str(type) if type else '' for type in TYPE_BY_CODE]
 lexer = Lexer()
+# 监控指标 按接口统计 其他路径(包括404)统计到other
+metrics = Metrics(['/getLex', '/getSyntaxMatch', '/batch', '/lexSession/open', '/lexSession/edit',
+                   '/lexSession/close', '/cacheStats', '/metrics', 'other'])
+# 词法/语法分析器各一个 所有请求共用 每次分析的状态在analyze返回的上下文中
+# 进程启动时加载编译好的文法 请求中不再做任何初始化
+# 只需要匹配结果 不生成分析过程表
+syntaxer = Syntaxer(trace=TRACE_OFF, engine=ENGINE_FAST)
+syntaxer.load_grammar()
 
+# 分析结果缓存 总大小上限(字节)与有效期(秒) 可通过环境变量配置
+CACHE_MAX_BYTES = int(os.environ.get('PYCOMPILER_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+CACHE_TTL = float(os.environ.get('PYCOMPILER_CACHE_TTL', 10 * 60))
 
-@app.route('/getLex', methods = ['POST'])
-def get_lex():
+
+class ResultCache():
+    """
+    按内容寻址的LRU结果缓存
+    键为分析类型+文法版本+源代码哈希 按结果的估算字节数淘汰最久未使用的项 超过有效期的项视为未命中
+    """
+
+    def __init__(self, max_bytes=CACHE_MAX_BYTES, ttl=CACHE_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.items = OrderedDict()  # 键 -> (结果, 字节数, 过期时间)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0  # 因总大小超限被淘汰的项数
+        self.expirations = 0  # 因过期被删除的项数
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """
+        :return: 结果 未命中时返回None
+        """
+        with self.lock:
+            item = self.items.get(key)
+            if item is not None and item[2] < time.time():
+                self.remove(key)
+                self.expirations += 1
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self.items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, value, size):
+        """
+        存入结果 单个结果超过总大小上限时不缓存
+        :param size: 结果的估算字节数
+        """
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.items:
+                self.remove(key)
+            self.items[key] = (value, size, time.time() + self.ttl)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                oldest = next(iter(self.items))
+                self.remove(oldest)
+                self.evictions += 1
+
+    def remove(self, key):
+        value, size, _ = self.items.pop(key)
+        self.bytes -= size
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+            self.bytes = 0
+
+    def stats(self):
+        """
+        :return: dict 命中/未命中次数与当前占用
+        """
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'expirations': self.expirations, 'items': len(self.items), 'bytes': self.bytes,
+                    'max_bytes': self.max_bytes, 'ttl': self.ttl}
+
+
+result_cache = ResultCache()
+
+# 增量词法分析会话 会话id -> (LexSession, 最近使用时间) 按最近使用排序
+MAX_SESSIONS = 256
+SESSION_TTL = 30 * 60
+sessions = OrderedDict()
+sessions_lock = threading.Lock()
+
+
+def lex_lines(lex_result):
+    """
+    词法分析结果转换为返回给前端的文本行 无法识别的token类型为None
+    """
+    return [str(result) for result in lex_result]
+
+
+def get_session(session_id):
+    """
+    取出会话并刷新最近使用时间 同时清理过期的会话
+    :return: LexSession or None
+    """
+    now = time.time()
+    with sessions_lock:
+        while sessions:
+            oldest_id, (_, used) = next(iter(sessions.items()))
+            if now - used <= SESSION_TTL:
+                break
+            del sessions[oldest_id]
+        item = sessions.get(session_id)
+        if item is None:
+            return None
+        sessions[session_id] = (item[0], now)
+        sessions.move_to_end(session_id)
+        return item[0]
+
+
+def read_source():
+    """
+    按Content-Type读取请求体中的源代码
+    application/json: JSON字符串 或 {"code": 源代码} 由标准库解码一次
+    text/plain, application/octet-stream: 请求体就是utf-8编码的源代码 原样返回字节 需要时才解码
+    其他类型(旧版前端未设置类型): 以"开头按JSON处理 否则按原始文本处理
+    请求体超过MAX_BODY_BYTES时抛出RequestEntityTooLarge
+    :return: (str 源代码 或 None, bytes 原始源代码 或 None) 两者恰有一个不为None
+    """
+    raw = request.get_data(cache=False)
+    if len(raw) > MAX_BODY_BYTES:
+        raise RequestEntityTooLarge()
+    mimetype = request.mimetype
+    if mimetype in RAW_TYPES or (mimetype != 'application/json' and raw[:1] != b'"'):
+        return None, raw
+    body = json.loads(raw)
+    if isinstance(body, dict):
+        body = body.get('code')
+    if not isinstance(body, str):
+        raise Exception('请求体中缺少源代码')
+    return body, None
+
+
+def failed(data, status=200):
+    """
+    分析失败(code为0)的响应 计入监控指标的出错数
+    """
+    g.failed = True
+    return jsonify(data), status
+
+
+def result_response(data):
+    """
+    分析结果的响应 code不为1时计为出错
+    """
+    if data.get('code') != 1:
+        return failed(data)
+    return jsonify(data)
+
+
+def source_error(e, msg, field):
+    """
+    读取请求体失败时的响应
+    """
+    if isinstance(e, RequestEntityTooLarge):
+        return failed({'code':0, 'msg':'请求体超过%d字节' % MAX_BODY_BYTES, field:''}, 413)
+    return failed({'code':0, 'msg':msg, field:str(e)})
+
+
+def analyze_lex(src, times=None):
+    """
+    词法分析 得到返回给前端的数据
+    :param times: PhaseTimes 给出时记入各阶段耗时
+    :return: dict
+    """
+    if times is None:
+        times = PhaseTimes()
     try:
-        req = request
-        raw = req.data
-        src = raw.decode('utf-8')
-        src = src[1:len(src)-1]
-        src = src.replace('\\t','\t')
-        src = src.replace('\\"','\"')
-        # src = src.replace('\\n', '\n')
-        src = src.replace('\\n', '\n')
-        src = src.replace('\\\n', '\\n')
-        src = src.replace('\\\\', '\\')
-        print(src)
-        lex_result = lexer.run(src)
+        ctx = lexer.analyze(src)
+        times.merge(ctx.times)
+        lex_result = ctx.lex_result
         results = []
         results.append("%s %s"%("Token".ljust(20),"Type"))
-        for result in lex_result:
-            result = str(result)
-            # result.replace('\n','\\n')
-            results.append(str(result))
-        data = {'lex_result':results, 'code':1, 'msg':'词法分析成功!'}
-        return jsonify(data)
+        with times.phase('format'):
+            for result in lex_result:
+                result = str(result)
+                # result.replace('\n','\\n')
+                results.append(str(result))
+        return {'lex_result':results, 'code':1, 'msg':'词法分析成功!'}
     except Exception as e:
-        data = {'code':0, 'msg':'词法分析失败, 可能存在语法错误', 'lex_result':str(e)}
-        return jsonify(data)
+        return {'code':0, 'msg':'词法分析失败, 可能存在语法错误', 'lex_result':str(e)}
 
-@app.route('/getSyntaxMatch', methods = ['POST'])
-def get_syntax_match():
+
+def analyze_syntax(src, times=None):
+    """
+    语法分析 得到返回给前端的数据
+    :param times: PhaseTimes 给出时记入各阶段耗时
+    :return: dict
+    """
     try:
-        syntaxer = Syntaxer()
-        req = request
-        raw = req.data
-        src = raw.decode('utf-8')
-        src = src[1:len(src)-1]
-        src = src.replace('\\t','\t')
-        src = src.replace('\\"','\"')
-        # src = src.replace('\\n', '\n')
-        src = src.replace('\\n', '\n')
-        src = src.replace('\\\n', '\\n')
-        src = src.replace('\\\\', '\\')
-        print(src)
-        is_match = syntaxer.run(src)
+        ctx = syntaxer.analyze(src)
+        if times is not None:
+            times.merge(ctx.times)
+        is_match = ctx.is_match
         if is_match:
             result_info = '语法通过'
         else:
             result_info = '语法存在错误'
-        data = {'result': result_info, 'code':1, 'msg':'语法分析成功!'}
+        return {'result': result_info, 'code':1, 'msg':'语法分析成功!'}
+    except Exception as e:
+        return {'code':0, 'msg':'语法分析失败, 可能存在语法错误', 'result':str(e)}
+
+
+def analyze_lex_wire(src, times=None):
+    """
+    词法分析 结果编码为LexWire格式 分词与编码交替进行 合计为一个阶段
+    :param times: PhaseTimes 给出时记入耗时
+    :return: dict 成功时wire为编码后的bytes
+    """
+    if times is None:
+        times = PhaseTimes()
+    try:
+        with times.phase('scan_encode'):
+            spans = ((type.value, start, end) for type, start, end in lexer.iter_spans(src))
+            return {'wire': LexWire.encode(src, spans, WIRE_TYPE_NAMES), 'code':1}
+    except Exception as e:
+        return {'code':0, 'msg':'词法分析失败, 可能存在语法错误', 'lex_result':str(e)}
+
+
+def data_size(data):
+    """
+    估算结果占用的字节数
+    """
+    size = 256
+    for value in data.values():
+        if isinstance(value, bytes):
+            size += len(value)
+        elif isinstance(value, list):
+            size += sum(len(item) + 64 for item in value)
+        else:
+            size += len(str(value))
+    return size
+
+
+def cache_key(kind, src, raw=None):
+    """
+    结果缓存的键
+    分析结果只由源代码与文法决定 键中包含文法版本 文法配置修改后旧结果自动失效
+    :param kind: 分析类型
+    :param src: 源代码
+    :param raw: 源代码的utf-8编码 给出时直接使用 不再编码src
+    :return: tuple
+    """
+    syntaxer.load_grammar()
+    if raw is None:
+        raw = src.encode('utf-8', 'surrogatepass')
+    h = hashlib.sha256(raw).hexdigest()
+    return (kind, syntaxer.grammar_digest, h)
+
+
+def cached_analyze(kind, analyze, src, raw=None, times=None):
+    """
+    先查结果缓存 未命中时分析并存入
+    :param kind: 分析类型
+    :param analyze: 分析函数 参数为(源代码, PhaseTimes)
+    :param src: 源代码 为None时由raw解码
+    :param raw: 源代码的utf-8编码 命中缓存时不需要解码 解码失败时抛出UnicodeDecodeError
+    :param times: PhaseTimes 记录查缓存/解码/分析各阶段的耗时
+    :return: dict
+    """
+    if times is None:
+        times = PhaseTimes()
+    with times.phase('cache'):
+        key = cache_key(kind, src, raw)
+        data = result_cache.get(key)
+    if data is None:
+        if src is None:
+            with times.phase('decode'):
+                src = raw.decode('utf-8')
+        data = analyze(src, times)
+        result_cache.put(key, data, data_size(data))
+    return data
+
+
+def lex_response_type():
+    """
+    按Accept协商/getLex的结果类型 查询参数stream=1等同于要求NDJSON_TYPE
+    :return: LEX_TYPES之一
+    """
+    if request.args.get('stream') in ('1', 'true'):
+        return NDJSON_TYPE
+    return request.accept_mimetypes.best_match(LEX_TYPES) or LEX_TYPES[0]
+
+
+def iter_lex_stream(source):
+    """
+    流式词法分析 token由词法分析器逐个产出 每STREAM_BATCH个输出一行
+    中间行: {"lex_result": [...]} 各行的lex_result依次拼接后与非流式结果相同(第一行含表头)
+    最后一行: {"code": 1, "msg": ..., "count": token数} 出错时为{"code": 0, "msg": ..., "lex_result": 错误信息}
+    响应头发出后状态码不能再修改 所以成功与否以最后一行为准
+    :param source: 源代码 str 或utf-8编码的bytes
+    :return: 生成器 str
+    """
+    results = ["%s %s"%("Token".ljust(20),"Type")]
+    count = 0
+    try:
+        for result in lexer.iter_lex(source):
+            results.append(str(result))
+            count += 1
+            if len(results) >= STREAM_BATCH:
+                yield json.dumps({'lex_result':results}) + '\n'
+                results = []
+        if results:
+            yield json.dumps({'lex_result':results}) + '\n'
+        metrics.add_tokens('/getLex', count)
+        yield json.dumps({'code':1, 'msg':'词法分析成功!', 'count':count}) + '\n'
+    except Exception as e:
+        yield json.dumps({'code':0, 'msg':'词法分析失败, 可能存在语法错误', 'lex_result':str(e)}) + '\n'
+
+
+@app.route('/getLex', methods = ['POST'])
+def get_lex():
+    try:
+        with g.times.phase('read_body'):
+            src, raw = read_source()
+        mimetype = lex_response_type()
+        if mimetype == NDJSON_TYPE:
+            # 流式结果不经过结果缓存 服务端只保留当前一批token
+            return Response(iter_lex_stream(raw if src is None else src), mimetype=NDJSON_TYPE)
+        if mimetype == LexWire.MIME_TYPE:
+            data = cached_analyze('lex-wire', analyze_lex_wire, src, raw, g.times)
+            if data['code'] != 1:
+                return failed(data)
+            metrics.add_tokens('/getLex', LexWire.HEADER.unpack_from(data['wire'])[4])
+            return Response(data['wire'], mimetype=LexWire.MIME_TYPE)
+        data = cached_analyze('lex', analyze_lex, src, raw, g.times)
+        if data['code'] == 1:
+            metrics.add_tokens('/getLex', len(data['lex_result']) - 1)
+        with g.times.phase('serialize'):
+            return result_response(data)
+    except Exception as e:
+        return source_error(e, '词法分析失败, 可能存在语法错误', 'lex_result')
+
+@app.route('/getSyntaxMatch', methods = ['POST'])
+def get_syntax_match():
+    try:
+        with g.times.phase('read_body'):
+            src, raw = read_source()
+        data = cached_analyze('syntax', analyze_syntax, src, raw, g.times)
+        with g.times.phase('serialize'):
+            return result_response(data)
+    except Exception as e:
+        return source_error(e, '语法分析失败, 可能存在语法错误', 'result')
+
+
+@app.route('/cacheStats', methods = ['GET'])
+def cache_stats():
+    return jsonify(result_cache.stats())
+
+
+@app.route('/lexSession/open', methods = ['POST'])
+def open_lex_session():
+    """
+    打开文档 请求体 {"code": 文档内容}
+    返回会话id与完整的词法分析结果
+    """
+    try:
+        body = request.get_json(force=True)
+        session = LexSession(lexer, body.get('code', ''))
+        session_id = uuid.uuid4().hex
+        with sessions_lock:
+            sessions[session_id] = (session, time.time())
+            while len(sessions) > MAX_SESSIONS:
+                sessions.popitem(last=False)
+        results = ["%s %s"%("Token".ljust(20),"Type")] + lex_lines(session.lex_result())
+        data = {'session': session_id, 'version': session.version, 'errors': session.errors,
+                'lex_result': results, 'code':1, 'msg':'词法分析成功!'}
         return jsonify(data)
     except Exception as e:
-        data = {'code':0, 'msg':'语法分析失败, 可能存在语法错误', 'result':str(e)}
+        data = {'code':0, 'msg':'词法分析失败, 可能存在语法错误', 'lex_result':str(e)}
+        return failed(data)
+
+
+@app.route('/lexSession/edit', methods = ['POST'])
+def edit_lex_session():
+    """
+    修改文档 请求体 {"session": 会话id, "start": 起点, "end": 终点, "text": 新内容}
+    位置为字符偏移 将[start, end)替换为text
+    返回被替换的token区间: 从第start个token起的removed个token 替换为lex_result
+    """
+    try:
+        body = request.get_json(force=True)
+        session = get_session(body.get('session'))
+        if session is None:
+            return failed({'code':0, 'msg':'会话不存在或已过期', 'lex_result':''})
+        with sessions_lock:
+            k, removed, added = session.edit(int(body['start']), int(body['end']), body.get('text', ''))
+            results = lex_lines(session.lex_result(k, k + added))
+        data = {'version': session.version, 'errors': session.errors, 'start': k, 'removed': removed,
+                'lex_result': results, 'code':1, 'msg':'词法分析成功!'}
         return jsonify(data)
-    
+    except Exception as e:
+        data = {'code':0, 'msg':'词法分析失败, 可能存在语法错误', 'lex_result':str(e)}
+        return failed(data)
+
+
+@app.route('/lexSession/close', methods = ['POST'])
+def close_lex_session():
+    """
+    关闭文档 请求体 {"session": 会话id}
+    """
+    try:
+        body = request.get_json(force=True)
+        assert isinstance(body, dict), '请求体应为JSON对象'
+        with sessions_lock:
+            sessions.pop(body.get('session'), None)
+        return jsonify({'code':1, 'msg':'会话已关闭'})
+    except Exception as e:
+        data = {'code':0, 'msg':'关闭会话失败, 请求格式错误', 'lex_result':str(e)}
+        return failed(data)
+
+
+# 批量分析 整个服务的进程池进程数与单次请求的最大条目数
+BATCH_WORKERS = int(os.environ.get('PYCOMPILER_BATCH_WORKERS', os.cpu_count() or 1))
+BATCH_MAX_ITEMS = int(os.environ.get('PYCOMPILER_BATCH_MAX_ITEMS', 1000))
+ANALYZERS = {'lex': analyze_lex, 'syntax': analyze_syntax}
+batch_pool = None
+batch_pool_size = BATCH_WORKERS  # 本进程的进程池大小 多进程服务时由各工作进程平分BATCH_WORKERS
+batch_pool_lock = threading.Lock()
+
+
+def init_batch_worker():
+    """
+    工作进程启动时加载编译好的文法 之后该进程处理的条目不再加载
+    """
+    syntaxer.load_grammar()
+
+
+def batch_analyze(kind, src):
+    """
+    在工作进程中执行一项分析
+    """
+    return ANALYZERS[kind](src)
+
+
+def get_batch_pool():
+    """
+    第一次批量请求时创建进程池
+    :return: ProcessPoolExecutor
+    """
+    global batch_pool
+    with batch_pool_lock:
+        if batch_pool is None:
+            batch_pool = ProcessPoolExecutor(max_workers=batch_pool_size, initializer=init_batch_worker)
+        return batch_pool
+
+
+def wait_futures(futures):
+    """
+    等待全部任务完成 在gevent线程池中等待 不阻塞事件循环 其他请求照常处理
+    """
+    gevent.get_hub().threadpool.spawn(wait, futures).get()
+
+
+def parse_batch_item(item, analyses):
+    """
+    解析批量请求中的一项
+    :param item: 源代码字符串 或 {"code": 源代码, "analyses": [分析类型]}
+    :param analyses: 未指定时使用的分析类型
+    :return: (源代码, 分析类型列表)
+    """
+    if isinstance(item, dict):
+        src = item.get('code')
+        analyses = item.get('analyses', analyses)
+    else:
+        src = item
+    if not isinstance(src, str):
+        raise Exception('缺少源代码')
+    if isinstance(analyses, str):
+        analyses = [analyses]
+    for kind in analyses:
+        if kind not in ANALYZERS:
+            raise Exception('未知的分析类型%s' % kind)
+    return src, list(analyses)
+
+
+@app.route('/batch', methods = ['POST'])
+def batch():
+    """
+    批量分析 请求体 {"items": [源代码 或 {"code": 源代码, "analyses": ["lex", "syntax"]}], "analyses": 默认分析类型}
+    各条目分发到进程池 按顺序返回结果 单个条目出错只影响该条目
+    返回 {"results": [{"lex": 同/getLex, "syntax": 同/getSyntaxMatch} 或 {"error": 错误信息}]}
+    """
+    try:
+        body = request.get_json(force=True)
+        items = body['items'] if isinstance(body, dict) else body
+        analyses = body.get('analyses', ['lex', 'syntax']) if isinstance(body, dict) else ['lex', 'syntax']
+        assert isinstance(items, list), 'items应为列表'
+        assert len(items) <= BATCH_MAX_ITEMS, '条目数超过上限%d' % BATCH_MAX_ITEMS
+    except Exception as e:
+        return failed({'code':0, 'msg':'批量分析失败, 请求格式错误', 'results':str(e)})
+    results = []
+    pending = []  # (条目下标, 分析类型, 缓存键, 源代码)
+    for i, item in enumerate(items):
+        try:
+            src, kinds = parse_batch_item(item, analyses)
+        except Exception as e:
+            results.append({'error': str(e)})
+            continue
+        res = {}
+        for kind in kinds:
+            key = cache_key(kind, src)
+            data = result_cache.get(key)
+            if data is None:
+                pending.append((i, kind, key, src))
+            else:
+                res[kind] = data
+        results.append(res)
+    if len(pending) == 1:
+        # 只有一项时直接分析 省去进程间传输
+        i, kind, key, src = pending[0]
+        data = ANALYZERS[kind](src)
+        result_cache.put(key, data, data_size(data))
+        results[i][kind] = data
+    elif pending:
+        pool = get_batch_pool()
+        futures = [pool.submit(batch_analyze, kind, src) for _, kind, _, src in pending]
+        wait_futures(futures)
+        for (i, kind, key, _), future in zip(pending, futures):
+            try:
+                data = future.result()
+            except Exception as e:
+                results[i] = {'error': '%s: %s' % (kind, e)}
+                continue
+            result_cache.put(key, data, data_size(data))
+            if 'error' not in results[i]:
+                results[i][kind] = data
+    return jsonify({'results': results, 'code':1, 'msg':'批量分析完成'})
+
+
+@app.before_request
+def start_timing():
+    g.start_ns = perf_counter_ns()
+    g.times = PhaseTimes()
+    rule = request.url_rule
+    g.metric = metrics.begin(rule.rule if rule is not None else 'other')
+
+
+def record_metrics(status):
+    """
+    请求结束时记入监控指标 每个请求只记一次
+    """
+    base = g.pop('metric', None)
+    if base is not None:
+        seconds = (perf_counter_ns() - g.start_ns) / 1e9
+        metrics.end(base, seconds, request.content_length or 0, status >= 400 or g.get('failed', False))
+
 
 @app.after_request
 def func_res(resp):
     res = make_response(resp)
+    # 各阶段耗时 流式响应只包含响应头发出之前的阶段
+    times = g.get('times')
+    if times is not None:
+        times.add('total', perf_counter_ns() - g.start_ns)
+        res.headers['Server-Timing'] = times.server_timing()
+        res.headers['Timing-Allow-Origin'] = '*'
     res.headers['Access-Control-Allow-Origin'] = '*'
     res.headers['Access-Control-Allow-Methods'] = 'GET,POST'
     res.headers['Access-Control-Allow-Headers'] = 'x-requested-with,content-type'
+    record_metrics(res.status_code)
     return res
 
 
+@app.teardown_request
+def record_unhandled(e):
+    # 未捕获的异常不经过after_request
+    record_metrics(500)
+
+
+@app.route('/metrics', methods = ['GET'])
+def get_metrics():
+    """
+    Prometheus文本格式的监控指标 多进程服务时为所有工作进程的合计
+    """
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+# 多进程服务 可通过命令行参数或环境变量配置
+SERVE_HOST = os.environ.get('PYCOMPILER_HOST', '0.0.0.0')
+SERVE_PORT = int(os.environ.get('PYCOMPILER_PORT', 10086))
+SERVE_WORKERS = int(os.environ.get('PYCOMPILER_WORKERS', os.cpu_count() or 1))
+MAX_REQUESTS = int(os.environ.get('PYCOMPILER_MAX_REQUESTS', 0))  # 每个工作进程处理多少请求后重启 0表示不限
+GRACEFUL_TIMEOUT = float(os.environ.get('PYCOMPILER_GRACEFUL_TIMEOUT', 30))  # 停止工作进程时等待请求完成的秒数
+
+
+def warm_up():
+    """
+    加载文法 生成DFA 并各分析一次 使正则/转移表等在fork之前就绪 工作进程直接共享
+    文法配置有变化时会重新编译
+    """
+    syntaxer.load_grammar()
+    LexerGenerator.get_dfa(lexer.reserved, Operator, Delimiter)
+    sample = 'int main(){ int a = 1; return a; }'
+    lexer.analyze(sample)
+    syntaxer.analyze(sample, trace=TRACE_OFF)
+
+
+def create_listener(host, port):
+    """
+    创建监听socket 由所有工作进程共享
+    :return: socket
+    """
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((host, port))
+    listener.listen(1024)
+    listener.setblocking(False)
+    return listener
+
+
+def serve_worker(listener, max_requests=0):
+    """
+    工作进程 在共享的监听socket上使用gevent服务
+    收到SIGTERM或处理完max_requests个请求后 停止接受新连接 等待当前请求完成后退出
+    等待期间的响应带Connection: close 长连接的客户端随后改连其他工作进程
+    :param listener: 监听socket
+    :param max_requests: 处理多少请求后退出 0表示不限 实际值加上10%以内的随机量 避免各进程同时重启
+    """
+    import gevent
+    from gevent.pool import Pool
+    if max_requests:
+        max_requests += random.randint(0, max_requests // 10)
+    served = 0
+    stopping = False
+
+    def stop():
+        nonlocal stopping
+        if not stopping:
+            stopping = True
+            # 关闭监听后serve_forever返回 并等待请求处理协程结束(最多GRACEFUL_TIMEOUT秒)
+            gevent.spawn(server.close)
+
+    def counted_app(environ, start_response):
+        nonlocal served
+        served += 1
+        if max_requests and served == max_requests:
+            stop()
+        if stopping:
+            def start_response_close(status, headers, exc_info=None):
+                headers = [(k, v) for k, v in headers if k.lower() != 'connection'] + [('Connection', 'close')]
+                return start_response(status, headers, exc_info)
+            return app(environ, start_response_close)
+        return app(environ, start_response)
+
+    # 请求处理协程放入协程池 停止时才能等待它们完成
+    server = WSGIServer(listener, counted_app, spawn=Pool())
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    gevent.signal_handler(signal.SIGTERM, stop)
+    server.serve_forever(stop_timeout=GRACEFUL_TIMEOUT)
+
+
+def serve_prefork(host, port, workers, max_requests=0):
+    """
+    主进程: 预先加载 再fork出workers个工作进程共享监听socket
+    工作进程退出(崩溃或达到max_requests)时补齐
+    SIGHUP: 平滑重启 重新加载文法后启动新一批工作进程 旧进程处理完当前请求后退出
+    SIGTERM/SIGINT: 平滑停止
+    """
+    warm_up()
+    listener = create_listener(host, port)
+    children = {}  # 工作进程pid -> 代数
+    state = {'generation': 0, 'reload': False, 'stop': False}
+    # 监控指标的槽位 平滑重启时新旧两批进程同时存活
+    metrics.share(workers * 2 + 1)
+    # 各工作进程有自己的批量分析进程池 平分BATCH_WORKERS 总进程数不随工作进程数成倍增长
+    global batch_pool_size
+    batch_pool_size = max(1, BATCH_WORKERS // workers)
+    slots = {}  # 工作进程pid -> 槽位
+
+    def spawn():
+        free = set(range(metrics.slots)) - set(slots.values())
+        if not free:
+            # 旧进程还没有退出 下一轮再补齐
+            return
+        slot = min(free)
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                metrics.use_slot(slot)
+                serve_worker(listener, max_requests)
+            except (SystemExit, KeyboardInterrupt):
+                pass
+            except BaseException:
+                # 输出异常 否则主进程只会不断补齐工作进程 看不到原因
+                traceback.print_exc()
+                code = 1
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(code)
+        children[pid] = state['generation']
+        slots[pid] = slot
+
+    def reap(pid):
+        children.pop(pid, None)
+        slot = slots.pop(pid, None)
+        if slot is not None:
+            metrics.reset_gauges(slot)
+
+    def on_reload(signum, frame):
+        state['reload'] = True
+
+    def on_stop(signum, frame):
+        state['stop'] = True
+
+    signal.signal(signal.SIGHUP, on_reload)
+    signal.signal(signal.SIGTERM, on_stop)
+    signal.signal(signal.SIGINT, on_stop)
+    print("Web Service running in http://%s:%d/ with %d workers (pid %d)" % (host, port, workers, os.getpid()))
+    while True:
+        # 回收已退出的工作进程
+        while children:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                break
+            reap(pid)
+        if state['stop']:
+            break
+        if state['reload']:
+            state['reload'] = False
+            state['generation'] += 1
+            warm_up()
+            old = [pid for pid, generation in children.items() if generation != state['generation']]
+            for _ in range(workers):
+                spawn()
+            for pid in old:
+                os.kill(pid, signal.SIGTERM)
+        alive = sum(1 for generation in children.values() if generation == state['generation'])
+        for _ in range(workers - alive):
+            spawn()
+        time.sleep(0.2)
+    for pid in children:
+        os.kill(pid, signal.SIGTERM)
+    deadline = time.time() + GRACEFUL_TIMEOUT
+    while children and time.time() < deadline:
+        pid, status = os.waitpid(-1, os.WNOHANG)
+        if pid == 0:
+            time.sleep(0.1)
+        else:
+            reap(pid)
+    for pid in children:
+        os.kill(pid, signal.SIGKILL)
+    listener.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='PyCompiler Web服务')
+    parser.add_argument('--host', default=SERVE_HOST, help='监听地址')
+    parser.add_argument('--port', type=int, default=SERVE_PORT, help='监听端口')
+    parser.add_argument('--workers', type=int, default=SERVE_WORKERS, help='工作进程数 默认CPU核数')
+    parser.add_argument('--max-requests', type=int, default=MAX_REQUESTS, help='每个工作进程处理多少请求后重启 0表示不限')
+    parser.add_argument('--debug', action='store_true', help='使用Flask调试服务器(单进程 自动重载)')
+    return parser.parse_args(argv)
+
+
 if __name__ == "__main__":
-    app.run('',10086,debug=True)
-    # Serve the app with gevent
-    print("Web Service running in http://localhost:10086/")
-    http_server = WSGIServer(('0.0.0.0',10086), app)
-    http_server.serve_forever()
+    args = parse_args()
+    if args.debug:
+        app.run(args.host, args.port, debug=True)
+    elif args.workers <= 1 or not hasattr(os, 'fork'):
+        # 单进程 使用gevent服务
+        warm_up()
+        print("Web Service running in http://%s:%d/" % (args.host, args.port))
+        http_server = WSGIServer((args.host, args.port), app)
+        http_server.serve_forever()
+    else:
+        serve_prefork(args.host, args.port, args.workers, args.max_requests)
@@ -7,8 +7,13 @@
 import sys
 import re
 import os
+import threading
+from array import array
 from enum import Enum
 from LexerForSyntaxer import Lexer
+import GrammarCompiler
+import ParserGenerator
+from Profiler import PhaseTimes
 
 # 分析表输出宽度控制
 PREDICT_WIDTH = 16
@@ -18,6 +23,22 @@ RECORD_WIDTHS = [6, 40, 140, 30, 10]
 # True: E->E+T|-E+格式
 # False:E->E + T|- E +格式
 V_SINGLE = False
+# 分析过程记录级别
+# off: 不记录 不输出
+# summary: 只统计步数等汇总信息
+# full: 记录每一步 并输出预测表与分析过程表
+TRACE_OFF = 'off'
+TRACE_SUMMARY = 'summary'
+TRACE_FULL = 'full'
+TRACE_LEVELS = (TRACE_OFF, TRACE_SUMMARY, TRACE_FULL)
+# 分析驱动程序
+# stack: 按文法符号运行 使用Stack
+# fast: 按符号编号运行 使用整数列表栈
+# generated: 使用ParserGenerator生成的分析模块 full级别需要逐步记录 改用fast
+ENGINE_STACK = 'stack'
+ENGINE_FAST = 'fast'
+ENGINE_GENERATED = 'generated'
+ENGINES = (ENGINE_STACK, ENGINE_FAST, ENGINE_GENERATED)
 
 
 class Syntaxer():
@@ -25,8 +46,12 @@ class Syntaxer():
     语法分析器
     """
 
-    def __init__(self, config_path='config/simple_c_grammar.xml'):
+    def __init__(self, config_path='config/simple_c_grammar.xml', trace=TRACE_FULL, engine=ENGINE_STACK):
+        assert trace in TRACE_LEVELS, '未知的记录级别%s' % trace
+        assert engine in ENGINES, '未知的分析驱动程序%s' % engine
         self.lexer = Lexer()
+        self.trace = trace  # 默认记录级别
+        self.engine = engine  # 默认分析驱动程序
         self.config_path = config_path
         self.vt = ['@', '#']  # 终结符
         self.vn = []  # 非终结符
@@ -35,11 +60,16 @@ class Syntaxer():
         self.first = {}  # first集
         self.follow = {}  # follow集
         self.select = {}  # select集
+        self.analysis = None  # 位集形式的分析结果
         self.start_v = None  # 文法开始符
         self.predict_table = self.LL1Table()  # 预测表
+        self.dense_table = self.DenseTable()  # 整数编码的预测表
         self.record = self.Record()  # 分析记录表
-
-        self.solving_vn = ''  # 记录正在求解的非终结符 防止陷入死循环
+        self.summary = {}  # 分析过程汇总 步数/展开次数/匹配符号数
+        self.times = PhaseTimes()  # 最近一次run的各阶段耗时
+        self.grammar_digest = None  # 已加载文法产物对应的配置哈希
+        self.loaded = None  # 分析时使用的文法快照 (整数编码的预测表, 文法开始符, token替换表)
+        self.grammar_lock = threading.Lock()  # 加载/编译文法时加锁 分析过程不加锁
 
     class LL1Table():
         """
@@ -50,8 +80,18 @@ class Syntaxer():
             self.x_axis = []
             self.y_axis = []
             self.table = []
+            self.x_index = {}  # 终结符 -> 列号
+            self.y_index = {}  # 非终结符 -> 行号
             pass
 
+        def init_index(self):
+            """
+            建立符号到行列号的索引 查表时不再线性查找
+            :return:
+            """
+            self.x_index = {v: j for j, v in enumerate(self.x_axis)}
+            self.y_index = {v: i for i, v in enumerate(self.y_axis)}
+
         def init_table(self, vt: list, vn: list, select: dict):
             """
             构造预测表
@@ -62,12 +102,13 @@ class Syntaxer():
             vt.remove('@')
             self.x_axis = vt
             self.y_axis = vn
+            self.init_index()
 
             def get_i(_vn):
-                return self.y_axis.index(_vn)
+                return self.y_index[_vn]
 
             def get_j(_vt):
-                return self.x_axis.index(_vt)
+                return self.x_index[_vt]
 
             self.table = [[None for j in range(len(self.x_axis))] for i in range(len(self.y_axis))]
             for _vn, generate in select:
@@ -115,23 +156,182 @@ class Syntaxer():
                 print()
 
         def __call__(self, vn, vt):
-            return self.table[self.y_axis.index(vn)][self.x_axis.index(vt)]\
-
+            return self.table[self.y_index[vn]][self.x_index[vt]]
 
-    class Record():
+    class DenseTable():
         """
-        分析记录表
+        整数编码的LL1预测表
+        文法符号在加载文法时统一编号: 终结符为0..n_vt-1 非终结符为n_vt..n_vt+n_vn-1
+        表为扁平数组 table[(vn_id - n_vt) * n_vt + vt_id] = 产生式编号 -1表示出错
         """
 
         def __init__(self):
-            self.record = [('步骤', '分析栈', '余留符号串', '产生式', '下一步动作')]
+            self.symbols = []  # 编号 -> 文法符号
+            self.ids = {}  # 文法符号 -> 编号
+            self.n_vt = 0
+            self.table = array('i')
+            self.lhs = []  # 产生式编号 -> 左部非终结符
+            self.rhs = []  # 产生式编号 -> 右部(文法中的原始形式)
+            self.rhs_rev = []  # 产生式编号 -> 逆序的右部编号元组 空串为()
+            self.rhs_rev_symbols = []  # 产生式编号 -> 逆序的右部符号元组 空串为()
+
+        def init_rev_symbols(self):
+            """
+            由rhs_rev得到逆序的右部符号元组 供按符号运行的栈直接压入
+            :return:
+            """
+            self.rhs_rev_symbols = [tuple(self.symbols[i] for i in rev) for rev in self.rhs_rev]
+
+        def init_table(self, vt: list, vn: list, grammar: dict, select: dict):
+            """
+            由select集构造整数编码的预测表
+            :param vt: 终结符 不含@
+            :param vn: 非终结符
+            :param grammar: 文法
+            :param select: select集
+            :return:
+            """
+            self.symbols = list(vt) + list(vn)
+            self.ids = {v: i for i, v in enumerate(self.symbols)}
+            self.n_vt = len(vt)
+            self.table = array('i', [-1]) * (len(vn) * self.n_vt)
+            self.lhs = []
+            self.rhs = []
+            self.rhs_rev = []
+            for _vn in vn:
+                row = (self.ids[_vn] - self.n_vt) * self.n_vt
+                for generate in grammar[_vn]:
+                    pid = len(self.rhs)
+                    self.lhs.append(_vn)
+                    self.rhs.append(generate)
+                    if is_empty_generate(generate):
+                        self.rhs_rev.append(())
+                    else:
+                        self.rhs_rev.append(tuple(self.ids[v] for v in reversed(tuple(generate))))
+                    for _vt in select[(_vn, generate)]:
+                        self.table[row + self.ids[_vt]] = pid
+            self.init_rev_symbols()
+
+        def dump(self):
+            """
+            导出为只含内置类型的dict 便于写入文法产物
+            :return: dict
+            """
+            return {'symbols': self.symbols, 'n_vt': self.n_vt, 'table': self.table.tobytes(),
+                    'lhs': self.lhs, 'rhs': self.rhs, 'rhs_rev': self.rhs_rev}
+
+        def load(self, data: dict):
+            """
+            从dump的结果恢复
+            :param data:
+            :return:
+            """
+            self.symbols = data['symbols']
+            self.ids = {v: i for i, v in enumerate(self.symbols)}
+            self.n_vt = data['n_vt']
+            self.table = array('i')
+            self.table.frombytes(data['table'])
+            self.lhs = data['lhs']
+            self.rhs = data['rhs']
+            self.rhs_rev = data['rhs_rev']
+            self.init_rev_symbols()
+
+        def __call__(self, vn_id, vt_id):
+            return self.table[(vn_id - self.n_vt) * self.n_vt + vt_id]
+
+
+    class Context():
+        """
+        一次语法分析的状态与结果
+        文法表在开始时取快照 分析中途文法被重新加载也不受影响 Syntaxer本身不保存本次分析的任何状态
+        """
+
+        def __init__(self, table, start_v, token_subs, trace=TRACE_OFF, engine=ENGINE_STACK):
+            self.table = table  # DenseTable
+            self.start_v = start_v  # 文法开始符
+            self.token_subs = token_subs  # token与文法符号替换表
+            self.trace = trace  # 记录级别
+            self.engine = engine  # 分析驱动程序
+            self.is_match = False
+            self.record = None  # 分析记录表
+            self.summary = {}  # 分析过程汇总
+            self.n_tokens = 0  # 待分析的token数 不含#
+            self.times = PhaseTimes()  # 各阶段耗时
+
+    class Record():
+        """
+        分析记录表
+        每一步只记录增量(动作, 产生式编号, 扫描指针) 代价与分析栈/余留串长度无关
+        可读的表格在rows/print时由增量回放得到
+        """
+        EXPAND = 0  # 用产生式展开栈顶非终结符
+        MATCH = 1  # 栈顶终结符与扫描符号匹配
+        ACCEPT = 2  # 匹配成功
+
+        def __init__(self, table=None, start_v=None, analysis=()):
+            self.header = ('步骤', '分析栈', '余留符号串', '产生式', '下一步动作')
+            self.table = table  # DenseTable 回放时取产生式
+            self.start_v = start_v  # 文法开始符
+            self.analysis = analysis  # 待分析的串
+            self.actions = array('b')
+            self.pids = array('i')
+            self.scans = array('i')
             self.analysis_str = ''  # 分析串
 
-        def append(self, step, stack_list, remain_list, generate, next_step):
-            if isinstance(remain_list, list) or isinstance(remain_list, tuple):
-                self.record.append((step, ''.join(stack_list), ''.join(remain_list), generate, next_step))
-            if isinstance(remain_list, str):
-                self.record.append((step, ''.join(stack_list), remain_list, generate, next_step))
+        def append(self, action, pid, scan_p):
+            """
+            记录一步
+            :param action: EXPAND/MATCH/ACCEPT
+            :param pid: 产生式编号 非EXPAND时为-1
+            :param scan_p: 扫描指针
+            :return:
+            """
+            self.actions.append(action)
+            self.pids.append(pid)
+            self.scans.append(scan_p)
+
+        def __len__(self):
+            return len(self.actions)
+
+        def rows(self):
+            """
+            回放增量 逐行生成可读的记录
+            :return: generator (步骤, 分析栈, 余留符号串, 产生式, 下一步动作)
+            """
+            table = self.table
+            symbols = table.symbols
+            work = self.analysis
+            stack = [table.ids['#'], table.ids[self.start_v]]
+            for step, (action, pid, scan_p) in enumerate(zip(self.actions, self.pids, self.scans)):
+                stack_str = ''.join([symbols[i] for i in stack])
+                remain_str = ''.join(work[scan_p:])
+                top = symbols[stack[-1]]
+                if action == self.EXPAND:
+                    generate = table.rhs[pid]
+                    if isinstance(generate, list) or isinstance(generate, tuple):
+                        generate_str = ' '.join(generate)
+                    else:
+                        generate_str = generate
+                    if table.rhs_rev[pid]:
+                        next_step = '弹出%s, %s进栈' % (top, generate_str[::-1])
+                    else:
+                        next_step = '弹出%s' % top
+                    yield (step, stack_str, remain_str, '%s→%s' % (top, generate_str), next_step)
+                    stack.pop()
+                    stack.extend(table.rhs_rev[pid])
+                elif action == self.MATCH:
+                    yield (step, stack_str, remain_str, '', '弹出%s, 扫描指针后移一个符号' % top)
+                    stack.pop()
+                else:
+                    yield (step, stack_str, remain_str, '', '匹配成功')
+
+        @property
+        def record(self):
+            """
+            完整的记录表 首行为表头
+            :return: list
+            """
+            return [self.header] + list(self.rows())
 
         def width_adaptive(self):
             """
@@ -139,7 +339,7 @@ class Syntaxer():
             :return:
             """
             widths = [0, 0, 0, 0, 0]
-            for row in self.record[1:]:
+            for row in self.rows():
                 for i, item in enumerate(row):
                     if len(str(item))>widths[i]:
                         widths[i] = len(str(item)) + 5
@@ -147,10 +347,10 @@ class Syntaxer():
 
         def print(self):
             WIDTHS = self.width_adaptive()
-            for i, header in enumerate(self.record[0]):
+            for i, header in enumerate(self.header):
                 print(str(header).ljust(WIDTHS[i] - 2), end='')
             print()
-            for row in self.record[1:]:
+            for row in self.rows():
                 for i, item in enumerate(row):
                     print(str(item).ljust(WIDTHS[i]), end='')
                 print()
@@ -168,21 +368,106 @@ class Syntaxer():
         :return:
         """
         with open(self.config_path, 'r', encoding='utf-8') as f:
-            config_raw = f.read()
-            wrap_subs = '~'
-            config_raw = config_raw.replace('\n', wrap_subs)
-            vt_raw = re.findall(r'<vt>(.*?)</vt>', config_raw)[0]
-            # vn_raw = re.findall(r'<vn>(.*?)</vn>', config_raw)[0]
-            replace_raw = re.findall(r'<replace>(.*?)</replace>', config_raw)[0]
-            grammar_raw = re.findall(r'<grammar>(.*?)</grammar>', config_raw)[0]
-            vt_raw = vt_raw.strip(wrap_subs)
-            # vn_raw = vn_raw.strip(wrap_subs)
-            replace_raw = replace_raw.strip(wrap_subs).replace(wrap_subs, '\n')
-            grammar_raw = grammar_raw.strip(wrap_subs).replace(wrap_subs, '\n')
-            self.read_vt(vt_raw)
-            # self.read_vn(vn_raw)
-            self.read_token_subs(replace_raw)
-            self.read_grammar(grammar_raw)
+            self.parse_conf(f.read())
+
+    def parse_conf(self, config_raw):
+        """
+        解析配置文本
+        :param config_raw: 配置文件内容
+        :return:
+        """
+        wrap_subs = '~'
+        config_raw = config_raw.replace('\r', '').replace('\n', wrap_subs)
+        vt_raw = re.findall(r'<vt>(.*?)</vt>', config_raw)[0]
+        # vn_raw = re.findall(r'<vn>(.*?)</vn>', config_raw)[0]
+        replace_raw = re.findall(r'<replace>(.*?)</replace>', config_raw)[0]
+        grammar_raw = re.findall(r'<grammar>(.*?)</grammar>', config_raw)[0]
+        vt_raw = vt_raw.strip(wrap_subs)
+        # vn_raw = vn_raw.strip(wrap_subs)
+        replace_raw = replace_raw.strip(wrap_subs).replace(wrap_subs, '\n')
+        grammar_raw = grammar_raw.strip(wrap_subs).replace(wrap_subs, '\n')
+        self.read_vt(vt_raw)
+        # self.read_vn(vn_raw)
+        self.read_token_subs(replace_raw)
+        self.read_grammar(grammar_raw)
+
+    def compile_grammar(self, config_raw, times=None):
+        """
+        编译文法: 解析配置 求first/follow/select集 检查LL(1) 构造预测表
+        :param config_raw: 配置文件内容
+        :param times: PhaseTimes 记录read_conf/init_data/init_table的耗时
+        :return: dict 文法产物 由GrammarCompiler负责缓存
+        """
+        if times is None:
+            times = PhaseTimes()
+        self.vt = ['@', '#']
+        self.vn = []
+        self.token_subs = {}
+        self.grammar = {}
+        self.first = {}
+        self.follow = {}
+        self.select = {}
+        with times.phase('read_conf'):
+            self.parse_conf(config_raw)
+        with times.phase('init_data'):
+            self.init_data()  # 初始化各种数据结构
+        # 判断是否是LL1文法 不是的话报错
+        if not self.is_LL1_grammar():
+            vn, a, b, common = self.analysis.conflicts()[0]
+            raise Exception("配置的文法不满足LL(1)规则: %s→%s 与 %s→%s 的select集相交于 %s"
+                            % (vn, ' '.join(a), vn, ' '.join(b), ' '.join(common)))
+        # 构造LL1预测表 init_table会修改传入的vt 这里传副本
+        with times.phase('init_table'):
+            table = self.LL1Table()
+            table.init_table(list(self.vt), self.vn, self.select)
+            dense_table = self.DenseTable()
+            dense_table.init_table(table.x_axis, self.vn, self.grammar, self.select)
+        return {
+            'vt': self.vt,
+            'vn': self.vn,
+            'token_subs': self.token_subs,
+            'grammar': self.grammar,
+            'first': self.first,
+            'follow': self.follow,
+            'select': self.select,
+            'start_v': self.start_v,
+            'table': (table.x_axis, table.y_axis, table.table),
+            'dense_table': dense_table.dump(),
+        }
+
+    def load_grammar(self, times=None):
+        """
+        加载编译好的文法产物
+        同一进程内只编译/读取一次 配置文件内容变化时自动重新编译
+        分析使用的表最后一次性替换(self.loaded) 正在进行的分析不会看到一半新一半旧的文法
+        :param times: PhaseTimes 需要重新编译时记录编译各阶段的耗时
+        :return:
+        """
+        with self.grammar_lock:
+            self.load_grammar_locked(times)
+
+    def load_grammar_locked(self, times=None):
+        artifact = GrammarCompiler.load_artifact(self.config_path,
+                                                 lambda config_raw: self.compile_grammar(config_raw, times),
+                                                 self.grammar_digest)
+        if artifact is None:
+            # 文法没有变化
+            return
+        self.vt = artifact['vt']
+        self.vn = artifact['vn']
+        self.token_subs = artifact['token_subs']
+        self.grammar = artifact['grammar']
+        self.first = artifact['first']
+        self.follow = artifact['follow']
+        self.select = artifact['select']
+        self.start_v = artifact['start_v']
+        self.predict_table = self.LL1Table()
+        self.predict_table.x_axis, self.predict_table.y_axis, self.predict_table.table = artifact['table']
+        self.predict_table.init_index()
+        self.dense_table = self.DenseTable()
+        self.dense_table.load(artifact['dense_table'])
+        self.grammar_digest = artifact['digest']
+        self.loaded = (self.dense_table, self.start_v, self.token_subs)
 
     def read_vt(self, s: str):
         """
@@ -239,224 +524,329 @@ class Syntaxer():
         # 设置文法开始符
         self.start_v = start_v
 
-    def run(self, code_raw):
+    def new_context(self, trace=None, engine=None, times=None):
+        """
+        加载文法(已加载且未变化时只检查文件状态) 创建本次分析的上下文
+        :param trace: 记录级别 默认使用构造时的级别
+        :param engine: 分析驱动程序 默认使用构造时的设置
+        :param times: 本次分析的PhaseTimes 默认新建
+        :return: Context
+        """
+        if trace is None:
+            trace = self.trace
+        if engine is None:
+            engine = self.engine
+        assert trace in TRACE_LEVELS, '未知的记录级别%s' % trace
+        assert engine in ENGINES, '未知的分析驱动程序%s' % engine
+        # 加载编译好的文法 不满足LL(1)时在编译阶段报错
+        self.load_grammar(times)
+        table, start_v, token_subs = self.loaded
+        ctx = self.Context(table, start_v, token_subs, trace, engine)
+        if times is not None:
+            ctx.times = times
+        return ctx
+
+    def analyze(self, code_raw, trace=None, engine=None):
+        """
+        语法分析 本次分析的状态与结果都在返回的Context中 不修改Syntaxer
+        同一个Syntaxer可以同时被多个请求/线程使用
+        :param code_raw: 代码段
+        :param trace: 记录级别 off/summary/full 默认使用构造时的级别
+        :param engine: 分析驱动程序 stack/fast/generated 默认使用构造时的设置 结果一致
+        :return: Context
+        """
+        times = PhaseTimes()
+        with times.phase('load_grammar'):
+            ctx = self.new_context(trace, engine, times)
+        trace, engine = ctx.trace, ctx.engine
+        if trace == TRACE_FULL:
+            print(self.info_head() + "文法满足LL(1)规则")
+            # 输出LL1预测表
+            print(self.info_head() + "所构造LL(1)分析表为:")
+            with times.phase('predict_table.print'):
+                self.predict_table.print()
+        if engine == ENGINE_GENERATED and trace != TRACE_FULL:
+            with times.phase('tokenize'):
+                analyzed_ids, unknown = self.get_token_ids(code_raw, ctx)
+            ctx.n_tokens = len(analyzed_ids) - 1
+            ctx.record = self.Record(ctx.table, ctx.start_v, ())
+            with times.phase('load_parser'):
+                parser = ParserGenerator.load_parser(self)
+            with times.phase('driver'):
+                ctx.is_match, ctx.summary = parser.parse_ids(analyzed_ids, unknown)
+            if trace != TRACE_OFF:
+                self.info("匹配成功" if ctx.is_match else "匹配失败")
+        elif engine != ENGINE_STACK:
+            with times.phase('tokenize'):
+                analyzed_ids, unknown = self.get_token_ids(code_raw, ctx)  # 待分析的串 符号编号形式
+            ctx.n_tokens = len(analyzed_ids) - 1
+            if trace == TRACE_FULL:
+                symbols = ctx.table.symbols
+                analyzed_str = [symbols[i] if i >= 0 else unknown[k] for k, i in enumerate(analyzed_ids)]
+            else:
+                analyzed_str = ()
+            ctx.record = self.Record(ctx.table, ctx.start_v, analyzed_str)
+            with times.phase('driver'):
+                self.fast_driver(analyzed_ids, unknown, trace, ctx)
+        else:
+            with times.phase('tokenize'):
+                analyzed_str = self.get_tokens(code_raw, ctx)  # 待分析的串
+            ctx.n_tokens = len(analyzed_str) - 1
+            ctx.record = self.Record(ctx.table, ctx.start_v, analyzed_str)
+            with times.phase('driver'):
+                self.driver(analyzed_str, trace, ctx)  # 运行语法分析驱动程序
+        if trace == TRACE_SUMMARY:
+            self.info('分析共%(steps)d步, 展开产生式%(expands)d次, 匹配符号%(matches)d个' % ctx.summary)
+        elif trace == TRACE_FULL:
+            self.info('分析过程表为:')
+            with times.phase('record.print'):
+                ctx.record.print()
+        return ctx
+
+    def run(self, code_raw, trace=None, engine=None):
         """
         语法分析主控程序
+        结果同时保存在Syntaxer上(is_match/record/summary/times) 并发使用同一个Syntaxer时应调用analyze
         :param code_raw: 代码段
+        :param trace: 记录级别 off/summary/full 默认使用构造时的级别
+        :param engine: 分析驱动程序 stack/fast/generated 默认使用构造时的设置 结果一致
         :return: bool 匹配不匹配
         """
         self.is_match = False
-        self.read_conf()
-        self.init_data()  # 初始化各种数据结构
-        # 判断是否是LL1文法 不是的话报错
-        if not self.is_LL1_grammar():
-            raise Exception("配置的文法不满足LL(1)规则")
-        print(self.info_head() + "文法满足LL(1)规则")
-        # 构造LL1预测表
-        self.predict_table.init_table(self.vt, self.vn, self.select)
-        # 输出LL1预测表
-        print(self.info_head() + "所构造LL(1)分析表为:")
-        self.predict_table.print()
-        analyzed_str = self.get_tokens(code_raw)  # 待分析的串
-        self.driver(analyzed_str)  # 运行语法分析驱动程序
-        self.info('分析过程表为:')
-        self.record.print()
+        ctx = self.analyze(code_raw, trace, engine)
+        self.is_match = ctx.is_match
+        self.record = ctx.record
+        self.summary = ctx.summary
+        self.times = ctx.times
         return self.is_match
 
-    def get_tokens(self, code_raw):
+    def bind_context(self, ctx, trace, engine):
+        """
+        直接调用驱动程序而没有给出Context时 使用Syntaxer自身的record 结果写回Syntaxer
+        :return: Context
+        """
+        if ctx is not None:
+            return ctx
+        ctx = self.new_context(trace, engine)
+        ctx.record = self.record
+        return ctx
+
+    def get_tokens(self, code_raw, ctx=None):
+        """
+        词法分析得到文法终结符串
+        直接读取TokenBuffer的类型列查表 不构造lex对象
+        :param code_raw: 代码段
+        :param ctx: 本次分析的Context 默认使用当前加载的文法
+        :return: list 以#结尾
+        """
+        if ctx is None:
+            ctx = self.new_context()
         res = []
-        token_list = self.lexer.run(code_raw)
-        for lex in token_list:
-            type = lex.type
-            if type in self.token_subs.keys():
-                type = self.token_subs[type]
-            res.append(type)
+        buffer = self.lexer.tokenize(code_raw)
+        src = buffer.src
+        type_symbols = self.lexer.type_symbols
+        token_subs = ctx.token_subs
+        for code, start, length in zip(buffer.types, buffer.starts, buffer.lengths):
+            type = type_symbols[code]
+            if type is None:
+                type = src[start:start + length]
+            res.append(token_subs.get(type, type))
         res.append('#')
         return res
 
-    def driver(self, analysis):
+    def get_token_ids(self, code_raw, ctx=None):
+        """
+        词法分析得到文法终结符编号串 供fast_driver使用
+        不是终结符的符号(未知符号或非终结符名)编号记为-1 符号本身记在unknown中 分析到该位置时再报错
+        :param code_raw: 代码段
+        :param ctx: 本次分析的Context 默认使用当前加载的文法
+        :return: (array 以#的编号结尾, dict 位置 -> 未知符号)
+        """
+        if ctx is None:
+            ctx = self.new_context()
+        ids = ctx.table.ids
+        n_vt = ctx.table.n_vt
+        token_subs = ctx.token_subs
+        # TOKEN_TYPE值 -> 终结符编号 None表示需要按token本身查
+        code_ids = []
+        for type in self.lexer.type_symbols:
+            if type is None:
+                code_ids.append(None)
+            else:
+                v_id = ids.get(token_subs.get(type, type), -1)
+                code_ids.append(v_id if v_id < n_vt else -1)
+        res = array('i')
+        append = res.append
+        unknown = {}
+        buffer = self.lexer.tokenize(code_raw)
+        src = buffer.src
+        for code, start, length in zip(buffer.types, buffer.starts, buffer.lengths):
+            v_id = code_ids[code]
+            if v_id is None:
+                v = src[start:start + length]
+                v = token_subs.get(v, v)
+                v_id = ids.get(v, -1)
+                if v_id >= n_vt:
+                    v_id = -1
+                if v_id < 0:
+                    unknown[len(res)] = v
+            elif v_id < 0:
+                type = self.lexer.type_symbols[code]
+                unknown[len(res)] = token_subs.get(type, type)
+            append(v_id)
+        append(ids['#'])
+        return res, unknown
+
+    def fast_driver(self, work, unknown, trace=TRACE_OFF, ctx=None):
+        """
+        LL(1)分析驱动程序 按符号编号运行
+        栈为整数列表 产生式右部预先逆序 每步只做一次查表和一次extend
+        结果(is_match/summary/record)与driver一致
+        :param work: 待分析的终结符编号串
+        :param unknown: 位置 -> 未知符号
+        :param trace: 记录级别
+        :param ctx: 本次分析的Context 结果写入其中 为None时写回Syntaxer
+        :return:
+        """
+        bound = ctx is None
+        ctx = self.bind_context(ctx, trace, ENGINE_FAST)
+        table = ctx.table
+        n_vt = table.n_vt
+        cells = table.table
+        rhs_rev = table.rhs_rev
+        base = n_vt * n_vt  # 非终结符编号从n_vt开始 行起点为 top * n_vt - base
+        end_id = table.ids['#']
+        stack = [end_id, table.ids[ctx.start_v]]
+        pop = stack.pop
+        push = stack.extend
+        append = ctx.record.append if trace == TRACE_FULL else None
+        EXPAND = self.Record.EXPAND
+        MATCH = self.Record.MATCH
+        step = 0
+        expands = 0
+        scan_p = 0
+        v = work[0]
+        top = stack[-1]
+        while top != end_id:
+            if v < 0:
+                raise Exception("遇到未知的符号: %s" % unknown[scan_p])
+            if top >= n_vt:
+                pid = cells[top * n_vt - base + v]
+                if pid < 0:
+                    break
+                if append:
+                    append(EXPAND, pid, scan_p)
+                pop()
+                push(rhs_rev[pid])
+                expands += 1
+            elif top == v:
+                if append:
+                    append(MATCH, -1, scan_p)
+                pop()
+                scan_p += 1
+                v = work[scan_p]
+            else:
+                break
+            step += 1
+            top = stack[-1]
+        ctx.is_match = top == end_id == v
+        if ctx.is_match and append:
+            append(self.Record.ACCEPT, -1, scan_p)
+        ctx.summary = {'steps': step, 'expands': expands, 'matches': scan_p}
+        if bound:
+            self.is_match, self.summary = ctx.is_match, ctx.summary
+        if trace != TRACE_OFF:
+            self.info("匹配成功" if ctx.is_match else "匹配失败")
+
+    def driver(self, analysis, trace=TRACE_FULL, ctx=None):
         """
         LL(1)分析驱动程序
         :param 待分析的串
+        :param trace: 记录级别 full时每步向ctx.record追加一条增量
+        :param ctx: 本次分析的Context 结果写入其中 为None时写回Syntaxer
         :return:
         """
+        bound = ctx is None
+        ctx = self.bind_context(ctx, trace, ENGINE_STACK)
         step = 0  # 记录步骤
+        expands = 0  # 展开产生式的次数
         stack = Stack()  # 分析栈
         work = analysis  # 余留符号串
         scan_p = 0  # 扫描指针
+        table = ctx.table
+        ids = table.ids
+        n_vt = table.n_vt
+        append = ctx.record.append if trace == TRACE_FULL else None
+        verbose = trace != TRACE_OFF
         # 首先 # 开始符进栈
-        stack.push(['#', self.start_v])
+        stack.push(['#', ctx.start_v])
         while stack.top() != '#':
             top = stack.top()
             v = work[scan_p]  # 正在分析的符号
-            if v not in self.vt:
+            v_id = ids.get(v)
+            if v_id is None or v_id >= n_vt:
                 raise Exception("遇到未知的符号: %s"%v)
-            if top in self.vn:
+            top_id = ids[top]
+            if top_id >= n_vt:
                 # 如果栈顶是非终结符 进行规约
                 # 查分析表 如果 [top, v] is None 报错 识别失败
-                generate = self.predict_table(top, v)
-                if generate is None:
-                    self.info('匹配失败')
-                    return
-                if isinstance(generate, list) or isinstance(generate, tuple):
-                    generate_str = ' '.join(generate)
-                else:
-                    generate_str = generate
-                next_step = '弹出%s, %s进栈' % (top, generate_str[::-1])
-                if (V_SINGLE and generate == '@') or (not V_SINGLE and generate == ('@',)):
-                    next_step = '弹出%s' % top
-                self.record.append(step, stack.list(), work[scan_p:], '%s→%s' % (top, generate_str), next_step)
+                pid = table(top_id, v_id)
+                if pid < 0:
+                    break
+                if append:
+                    append(self.Record.EXPAND, pid, scan_p)
                 # 弹出top generate逆序进栈
                 stack.pop()
-                if (V_SINGLE and generate != '@') or (not V_SINGLE and generate != ('@',)):
-                    if isinstance(generate, str):
-                        stack.push(list(generate[::-1]))
-                    elif isinstance(generate, tuple) or isinstance(generate, list):
-                        stack.push(generate[::-1])
+                stack.push(table.rhs_rev_symbols[pid])
+                expands += 1
             else:
                 # 是终结符 与扫描符号进行比较
                 if top == v:
                     # 弹出v 指针后移
-                    next_step = '弹出%s, 扫描指针后移一个符号' % top
-                    self.record.append(step, stack.list(), work[scan_p:], '', next_step)
+                    if append:
+                        append(self.Record.MATCH, -1, scan_p)
                     stack.pop()
                     scan_p += 1
                 else:
-                    self.info('匹配失败')
-                    return
-                pass
+                    break
             step += 1
         if stack.top() == '#' == work[scan_p]:
-            self.record.append(step, stack.list(), work[scan_p:], '', '匹配成功')
-            self.info("匹配成功")
-            self.is_match = True
-        else:
-            self.info("匹配失败")
+            if append:
+                append(self.Record.ACCEPT, -1, scan_p)
+            ctx.is_match = True
+        ctx.summary = {'steps': step, 'expands': expands, 'matches': scan_p}
+        if bound:
+            self.is_match, self.summary = ctx.is_match, ctx.summary
+        if verbose:
+            self.info("匹配成功" if ctx.is_match else "匹配失败")
 
     def is_LL1_grammar(self):
         """
         判断是否是LL1文法
+        同一非终结符的各产生式select集两两不相交
         :return:
         """
-        for vn in self.vn:
-            lists = []
-            for generate in self.grammar[vn]:
-                key = (vn, generate)
-                lists.append(self.select[key])
-            # 各同一非终结符的select交集若不为空 则不是LL1文法
-            if len(self.intersect_list(lists)) > 0:
-                return False
-        return True
+        return len(self.analysis.conflicts()) == 0
 
     def init_data(self):
         """
         初始化各种集合
+        由GrammarCompiler.analyze以位集工作表算法一次求出 再转换为列表
         :return:
         """
-        # 求first集
+        self.analysis = GrammarCompiler.analyze(self.vt, self.vn, self.grammar, self.start_v)
+        to_list = self.analysis.to_list
+        # 求first集 可空的非终结符first集包括@
         for vn in self.vn:
-            self.first[vn] = self.get_first(self.grammar[vn])
+            self.first[vn] = to_list(self.analysis.first[vn])
+            if vn in self.analysis.nullable:
+                self.first[vn].append('@')
         # 求follow集
         for vn in self.vn:
-            self.solving_vn = vn
-            self.follow[vn] = self.get_follow(vn)
+            self.follow[vn] = to_list(self.analysis.follow[vn])
         # 求select集
-        for vn in self.vn:
-            for generate in self.grammar[vn]:
-                key = (vn, generate)  # 代表 vn->generate
-                res = []
-                # 如果@不属于first(generate) : first(generate)
-                # 如果@属于first(generate) : first(a, skip_empty) u follow(vn)
-                first = self.get_first([generate])
-                if '@' in first:
-                    first.remove('@')
-                    res = self.union(res, first, self.follow[vn])
-                else:
-                    res = self.union(res, self.get_first([generate]))
-                self.select[key] = res
-
-    def get_first(self, generate_list, skip_empty=False):
-        """
-        求first
-        :param generate_list: 生成式列表
-        :param skip_empty 跳过空串
-        :return: list
-        """
-        # 判断是否已经求过first集 有的话直接取用
-        # 判断是终结符还是非终结符
-        res = []
-        # 如果是空串
-        for generate in generate_list:
-            if (V_SINGLE and generate == '@') or (not V_SINGLE and generate == ('@',)):
-                if skip_empty:
-                    continue
-                else:
-                    res = self.union(res, ['@'])
-            for i, c in enumerate(generate):
-                if c in self.vt:
-                    res = self.union(res, [c])
-                    break
-                elif c in self.vn:
-                    if c in self.first.keys():
-                        c_first = self.first[c]
-                    else:
-                        _generate_list = self.grammar[c]
-                        c_first = self.get_first(_generate_list)
-                    if '@' in c_first and i + 1 < len(generate):
-                        # 会推导出@
-                        c_first.remove('@')
-                        res = self.union(res, c_first)
-                    else:
-                        res = self.union(res, c_first)
-                        break
-        return res
-
-    def get_follow(self, vn):
-        """
-        求vn的follow集
-        :return:
-        """
-        if vn in self.follow.keys():
-            # 之前已求得
-            return self.follow[vn]
-        res = []
-        if vn == self.start_v:
-            res.append('#')
-        for _vn, generate_list in self.grammar.items():
-            for generate in generate_list:
-                for i, v in enumerate(generate):
-                    if v == vn:
-                        flag = False
-                        for j in range(i+1, len(generate)):
-                            # 判断后面的first中是否包括空串 如果包括空串的话 循环向下判断
-                            after_first = self.get_first([generate[j:]])
-                            if '@' in after_first:
-                                # 如果后面的式子会出现空的情况
-                                after_first.remove('@')
-                                res = self.union(res, after_first)
-                            else:
-                                # 没有空的情况 直接退出循环
-                                res = self.union(res, after_first)
-                                flag = True
-                                break
-                        if flag:
-                            # 在最后一个符号之前已经得到了结果
-                            continue
-                        if _vn != self.solving_vn and _vn != vn:
-                            # 防止出现无限陷入递归
-                            res = self.union(res, self.get_follow(_vn))
-        return res
-
-    def has_empty_generate(self, vn):
-        """
-        非终结符是否能推导出空串 @
-        :param vn: 非终结符
-        :return:
-        """
-        for generate in self.grammar[vn]:
-            if (V_SINGLE and generate == '@') or (not V_SINGLE and generate == ('@',)):
-                return True
-        return False
+        for key, bits in self.analysis.select.items():
+            self.select[key] = to_list(bits)
 
     def union(self, a: list, *args):
         """
@@ -505,6 +895,15 @@ class Syntaxer():
         return ans
 
 
+def is_empty_generate(generate):
+    """
+    产生式右部是否为空串 @
+    :param generate: 产生式右部
+    :return:
+    """
+    return (V_SINGLE and generate == '@') or (not V_SINGLE and generate == ('@',))
+
+
 class Stack():
     """
     自写栈 通过封装list
@@ -554,9 +953,26 @@ class Stack():
         return self.arr
 
 
+"""
+    通过脚本方式调用
+    命令格式:
+        python Syntaxer.py [--profile] [trace] [engine]
+            trace: 记录级别 off/summary/full 默认full
+            engine: 分析驱动程序 stack/fast/generated 默认stack
+            --profile: 最后输出各阶段耗时
+"""
+
+
 if __name__ == '__main__':
+    arguments = sys.argv[1:]
+    profile = '--profile' in arguments
+    if profile:
+        arguments.remove('--profile')
     with open('grammar_test.c', 'r', encoding='utf-8') as f:
         code_raw = f.read()
-    syntaxer = Syntaxer(config_path='config/simple_c_grammar.xml')
+    trace = arguments[0] if len(arguments) > 0 else TRACE_FULL
+    engine = arguments[1] if len(arguments) > 1 else ENGINE_STACK
+    syntaxer = Syntaxer(config_path='config/simple_c_grammar.xml', trace=trace, engine=engine)
     syntaxer.run(code_raw)
-    pass
+    if profile:
+        print(syntaxer.times.format(syntaxer.info_head()))
@@ -0,0 +1,49 @@
+"""
+ 批量检查 单进程与多进程的结果一致
+"""
+
+import pytest
+import BatchChecker
+from conftest import CONFIG_PATH
+from BatchChecker import STATUS_PASS, STATUS_FAIL, STATUS_ERROR
+
+FILES = {
+    'pass.c': 'int main(){ int a = 1; return a; }',
+    'sub/pass2.c': 'int main(){ while (1) { a = a + 1; } return 0; }',
+    'fail.c': 'int main(){ int a = 1 return a; }',
+    'error.c': 'int main(){ int a = $; }',
+    'ignored.txt': 'not c',
+}
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    for name, code in FILES.items():
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(code, encoding='utf-8')
+    return tmp_path
+
+
+def test_collect_files(corpus):
+    files = BatchChecker.collect_files([str(corpus)])
+    assert [f[len(str(corpus)) + 1:] for f in files] == ['error.c', 'fail.c', 'pass.c', 'sub/pass2.c']
+    assert BatchChecker.collect_files([str(corpus / '**' / 'pass*.c')]) == [str(corpus / 'pass.c'),
+                                                                            str(corpus / 'sub' / 'pass2.c')]
+    with pytest.raises(Exception):
+        BatchChecker.collect_files([str(corpus / 'missing.c')])
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+@pytest.mark.parametrize('engine', ['stack', 'fast', 'generated'])
+def test_iter_results(corpus, jobs, engine):
+    files = BatchChecker.collect_files([str(corpus)])
+    results = {res['path'][len(str(corpus)) + 1:]: res
+               for res in BatchChecker.iter_results(files, jobs, CONFIG_PATH, 'syntax', engine)}
+    assert {name: res['status'] for name, res in results.items()} == {
+        'pass.c': STATUS_PASS, 'sub/pass2.c': STATUS_PASS, 'fail.c': STATUS_FAIL, 'error.c': STATUS_ERROR}
+    assert results['pass.c']['tokens'] == 14
+    summary = BatchChecker.Summary()
+    for res in results.values():
+        summary.add(res)
+    assert summary.as_dict()['passed'] == 2 and summary.files == 4
@@ -0,0 +1,144 @@
+"""
+ GrammarCompiler.analyze 与朴素不动点算法的结果对照
+"""
+
+import random
+import shutil
+import pytest
+import GrammarCompiler
+from conftest import CONFIG_PATH
+from Syntaxer import Syntaxer
+
+
+def reference(vt, vn, grammar, start_v, empty='@', end='#'):
+    """
+    朴素不动点算法 反复扫描全部产生式直到各集合不再变化
+    :return: (nullable, first, follow, select) 集合均为终结符的set
+    """
+    vn_set = set(vn)
+    nullable = set()
+    changed = True
+    while changed:
+        changed = False
+        for _vn in vn:
+            if _vn in nullable:
+                continue
+            for generate in grammar[_vn]:
+                if all(v == empty or v in nullable for v in generate):
+                    nullable.add(_vn)
+                    changed = True
+                    break
+
+    first = {_vn: set() for _vn in vn}
+
+    def seq_first(symbols):
+        res = set()
+        for v in symbols:
+            if v == empty:
+                continue
+            if v not in vn_set:
+                res.add(v)
+                return res, False
+            res |= first[v]
+            if v not in nullable:
+                return res, False
+        return res, True
+
+    changed = True
+    while changed:
+        changed = False
+        for _vn in vn:
+            for generate in grammar[_vn]:
+                bits = seq_first(generate)[0]
+                if not bits <= first[_vn]:
+                    first[_vn] |= bits
+                    changed = True
+
+    follow = {_vn: set() for _vn in vn}
+    follow[start_v].add(end)
+    changed = True
+    while changed:
+        changed = False
+        for _vn in vn:
+            for generate in grammar[_vn]:
+                for k, v in enumerate(generate):
+                    if v not in vn_set:
+                        continue
+                    bits, can_empty = seq_first(generate[k + 1:])
+                    if can_empty:
+                        bits = bits | follow[_vn]
+                    if not bits <= follow[v]:
+                        follow[v] |= bits
+                        changed = True
+
+    select = {}
+    for _vn in vn:
+        for generate in grammar[_vn]:
+            bits, can_empty = seq_first(generate)
+            select[(_vn, generate)] = bits | follow[_vn] if can_empty else bits
+    return nullable, first, follow, select
+
+
+def random_grammar(rand):
+    vt = ['a', 'b', 'c', '@', '#']
+    vn = ['S', 'A', 'B', 'C'][:rand.randrange(2, 5)]
+    grammar = {}
+    for _vn in vn:
+        generate_list = []
+        for _ in range(rand.randrange(1, 4)):
+            n = rand.randrange(4)
+            generate = tuple(rand.choice(vn + ['a', 'b', 'c']) for _ in range(n)) or ('@',)
+            if generate not in generate_list:
+                generate_list.append(generate)
+        grammar[_vn] = generate_list
+    return vt, vn, grammar
+
+
+def check(vt, vn, grammar, start_v='S'):
+    result = GrammarCompiler.analyze(vt, vn, grammar, start_v)
+    nullable, first, follow, select = reference(vt, vn, grammar, start_v)
+    assert result.nullable == nullable
+    assert {v: set(result.to_list(bits)) for v, bits in result.first.items()} == first
+    assert {v: set(result.to_list(bits)) for v, bits in result.follow.items()} == follow
+    assert {k: set(result.to_list(bits)) for k, bits in result.select.items()} == select
+
+
+@pytest.mark.parametrize('grammar', [
+    # 右部重复出现同一个可空非终结符
+    {'S': [('A',)], 'A': [('C', 'B', 'B')], 'B': [('@',)], 'C': [('@',)]},
+    # 以终结符开头的产生式不可空
+    {'S': [('@',), ('b',)], 'B': [('a', 'S', 'b', 'S')]},
+])
+def test_repeated_nonterminal(grammar):
+    vn = list(grammar)
+    check(['a', 'b', '@', '#'], vn, grammar)
+
+
+def test_random_grammars():
+    rand = random.Random(0)
+    for _ in range(3000):
+        check(*random_grammar(rand))
+
+
+def test_loaded_artifacts_are_copies():
+    a = Syntaxer(config_path=CONFIG_PATH)
+    a.load_grammar()
+    b = Syntaxer(config_path=CONFIG_PATH)
+    b.load_grammar()
+    assert a.vt == b.vt and a.vt is not b.vt
+    a.vt.remove('@')
+    a.select.clear()
+    assert '@' in b.vt and b.select
+
+
+def test_corrupt_artifact_is_recompiled(tmp_path):
+    config_path = str(tmp_path / 'grammar.xml')
+    shutil.copy(CONFIG_PATH, config_path)
+    with open(config_path, 'rb') as f:
+        digest = GrammarCompiler.config_digest(f.read())
+    path = GrammarCompiler.artifact_path(config_path, digest)
+    GrammarCompiler.write_artifact(path, b'\x80\x04not a marshal artifact')
+    syntaxer = Syntaxer(config_path=config_path)
+    syntaxer.load_grammar()
+    assert syntaxer.grammar_digest == digest
+    assert GrammarCompiler.read_artifact(path, digest) is not None
@@ -0,0 +1,37 @@
+"""
+ 增量词法分析会话 每次修改后的结果与整体重新扫描对照
+"""
+
+import random
+from Lexer import Lexer, LexSession
+
+ALPHABET = ['a', 'b1', 'int', ' ', '\n', '\t', '"', "'", '/', '*', '//', '/*', '*/', '=', '==', '+', '(', ')',
+            ';', '{', '}', '1', '.', '5', '\\', '#', '$']
+
+
+def snapshot(session):
+    return ([session.span(k) for k in range(len(session))], session.types, session.errors,
+            [(lex.token, lex.type) for lex in session.lex_result()])
+
+
+def check(session):
+    assert snapshot(session) == snapshot(LexSession(session.lexer, session.text))
+
+
+def test_unterminated_quote():
+    session = LexSession(Lexer('dfa'), '"\n\n')
+    session.edit(3, 3, '*')
+    check(session)
+    assert [lex.token for lex in session.lex_result()] == ['"\n\n*']
+
+
+def test_random_edits():
+    rand = random.Random(0)
+    lexer = Lexer('dfa')
+    for _ in range(300):
+        session = LexSession(lexer, ''.join(rand.choice(ALPHABET) for _ in range(rand.randrange(30))))
+        for _ in range(10):
+            start = rand.randrange(len(session.text) + 1)
+            end = rand.randrange(start, min(len(session.text), start + 5) + 1)
+            session.edit(start, end, ''.join(rand.choice(ALPHABET) for _ in range(rand.randrange(4))))
+            check(session)
@@ -0,0 +1,43 @@
+"""
+ LexWire二进制格式 编码/解码后与JSON格式的/getLex结果一致
+"""
+
+import os
+import pytest
+import LexWire
+import PyCompiler_web_service as web
+from conftest import ROOT
+
+
+@pytest.fixture(scope='module')
+def src():
+    with open(os.path.join(ROOT, 'test.c'), 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def test_round_trip(src):
+    spans = ((type.value, start, end) for type, start, end in web.lexer.iter_spans(src))
+    data = LexWire.encode(src, spans, web.WIRE_TYPE_NAMES)
+    expected = web.analyze_lex(src)['lex_result']
+    decoded = LexWire.decode(data)
+    assert LexWire.lex_lines(decoded) == expected
+    assert LexWire.HEADER.unpack_from(data)[4] == len(expected) - 1 == len(decoded['ids'])
+    for i, start in zip(decoded['ids'], decoded['starts']):
+        token = decoded['strings'][i]
+        assert src[start:start + len(token)] == token
+
+
+def test_endpoint(src):
+    client = web.app.test_client()
+    res = client.post('/getLex', json={'code': src}, headers={'Accept': LexWire.MIME_TYPE})
+    assert res.mimetype == LexWire.MIME_TYPE
+    expected = client.post('/getLex', json={'code': src}).get_json()['lex_result']
+    assert LexWire.lex_lines(LexWire.decode(res.data)) == expected
+
+
+def test_empty_and_bad_header():
+    data = LexWire.encode('', [], web.WIRE_TYPE_NAMES)
+    assert LexWire.HEADER.unpack_from(data)[4] == 0
+    assert LexWire.lex_lines(LexWire.decode(data)) == [web.analyze_lex('')['lex_result'][0]]
+    with pytest.raises(ValueError):
+        LexWire.decode(b'XXXX' + data[4:])
@@ -0,0 +1,47 @@
+"""
+ classic/regex/dfa三种分词后端的结果一致
+"""
+
+import pytest
+import Benchmark
+from Lexer import Lexer, BACKENDS
+
+EDGE_CASES = [
+    '',
+    'int a = $;',
+    'char *s = "unterminated\n int b;',
+    "char c = 'x",
+    'int a; /* open comment\n int b;',
+    'float f = 1.2.3;',
+    'a+++b>>=c<<d!=e',
+    '#include<stdio.h>\nint main(){ printf("%d\\n", 1); // tail',
+    'int\ta\r\n=\r\n1 ;',
+]
+
+
+def result(backend, code_raw):
+    """
+    :return: ('ok', [(token, type)]) 或 ('error', 错误信息)
+    """
+    try:
+        return 'ok', [(lex.token, str(lex.type)) for lex in Lexer(backend).run(code_raw)]
+    except Exception as e:
+        return 'error', str(e)
+
+
+def assert_same(code_raw):
+    expected = result(BACKENDS[0], code_raw)
+    for backend in BACKENDS[1:]:
+        assert result(backend, code_raw) == expected, backend
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_generated_corpus(seed):
+    code_raw = Benchmark.generate(5000, seed)
+    assert result('classic', code_raw)[0] == 'ok'
+    assert_same(code_raw)
+
+
+@pytest.mark.parametrize('code_raw', EDGE_CASES)
+def test_edge_cases(code_raw):
+    assert_same(code_raw)
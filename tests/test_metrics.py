@@ -0,0 +1,67 @@
+"""
+ 监控指标 直方图的桶边界/累计计数/_sum与_count 以及多槽位合计
+"""
+
+from Metrics import Metrics, LATENCY_BUCKETS, SIZE_BUCKETS
+
+
+def rendered(metrics):
+    return set(metrics.render().splitlines())
+
+
+def test_histograms():
+    metrics = Metrics(['/a', 'other'], prefix='t')
+    # 恰好等于上界的值计入该桶(le包含边界)
+    for seconds, size in ((0.001, 1024), (0.003, 1025), (20.0, 10 ** 9)):
+        metrics.end(metrics.begin('/a'), seconds, size)
+    metrics.end(metrics.begin('/unknown'), 0.0001, 0, error=True)
+    metrics.add_tokens('/a', 42)
+    lines = rendered(metrics)
+    for line in (
+            't_requests_total{endpoint="/a"} 3',
+            't_errors_total{endpoint="/a"} 0',
+            't_tokens_total{endpoint="/a"} 42',
+            't_requests_in_flight{endpoint="/a"} 0',
+            't_request_duration_seconds_bucket{endpoint="/a",le="0.0005"} 0',
+            't_request_duration_seconds_bucket{endpoint="/a",le="0.001"} 1',
+            't_request_duration_seconds_bucket{endpoint="/a",le="0.0025"} 1',
+            't_request_duration_seconds_bucket{endpoint="/a",le="0.005"} 2',
+            't_request_duration_seconds_bucket{endpoint="/a",le="10.0"} 2',
+            't_request_duration_seconds_bucket{endpoint="/a",le="+Inf"} 3',
+            't_request_duration_seconds_sum{endpoint="/a"} 20.004',
+            't_request_duration_seconds_count{endpoint="/a"} 3',
+            't_request_size_bytes_bucket{endpoint="/a",le="256"} 0',
+            't_request_size_bytes_bucket{endpoint="/a",le="1024"} 1',
+            't_request_size_bytes_bucket{endpoint="/a",le="4096"} 2',
+            't_request_size_bytes_bucket{endpoint="/a",le="16777216"} 2',
+            't_request_size_bytes_bucket{endpoint="/a",le="+Inf"} 3',
+            't_request_size_bytes_sum{endpoint="/a"} 1000002049',
+            't_request_size_bytes_count{endpoint="/a"} 3',
+            # 未知接口计入最后一个
+            't_requests_total{endpoint="other"} 1',
+            't_errors_total{endpoint="other"} 1',
+            't_request_duration_seconds_bucket{endpoint="other",le="0.0005"} 1',
+            't_request_size_bytes_bucket{endpoint="other",le="256"} 1',
+            't_request_size_bytes_sum{endpoint="other"} 0',
+    ):
+        assert line in lines
+    n_buckets = len(LATENCY_BUCKETS) + len(SIZE_BUCKETS) + 2
+    assert sum(1 for line in lines if line.startswith('t_request_') and '_bucket{endpoint="/a"' in line) == n_buckets
+
+
+def test_in_flight_and_shared_slots():
+    metrics = Metrics(['/a', 'other'], prefix='t')
+    metrics.begin('/a')
+    metrics.share(3)
+    metrics.use_slot(1)
+    base = metrics.begin('/a')
+    assert 't_requests_in_flight{endpoint="/a"} 2' in rendered(metrics)
+    metrics.end(base, 0.01, 10)
+    metrics.use_slot(2)
+    metrics.end(metrics.begin('/a'), 0.01, 10)
+    metrics.reset_gauges(0)
+    lines = rendered(metrics)
+    assert 't_requests_in_flight{endpoint="/a"} 0' in lines
+    assert 't_requests_total{endpoint="/a"} 2' in lines
+    assert 't_request_size_bytes_sum{endpoint="/a"} 20' in lines
+    assert 't_request_duration_seconds_count{endpoint="/a"} 2' in lines
@@ -0,0 +1,71 @@
+"""
+ 生成的语法分析模块与fast驱动程序的结果对照
+"""
+
+import os
+import shutil
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+import Benchmark
+import ParserGenerator
+from conftest import CONFIG_PATH
+from Syntaxer import Syntaxer, TRACE_OFF, ENGINE_FAST
+
+
+@pytest.fixture(scope='module')
+def syntaxer():
+    syntaxer = Syntaxer(config_path=CONFIG_PATH, trace=TRACE_OFF)
+    syntaxer.load_grammar()
+    return syntaxer
+
+
+def compare(syntaxer, code_raw):
+    work, unknown = syntaxer.get_token_ids(code_raw)
+    ctx = syntaxer.new_context(TRACE_OFF, ENGINE_FAST)
+    syntaxer.fast_driver(work, unknown, TRACE_OFF, ctx)
+    assert ParserGenerator.load_parser(syntaxer).parse_ids(work, unknown) == (ctx.is_match, ctx.summary)
+    return ctx.is_match
+
+
+def test_corpus(syntaxer):
+    for seed in range(50):
+        code_raw = Benchmark.generate(2000, seed)
+        assert compare(syntaxer, code_raw)
+        # 截断后的程序不匹配 失败位置也应一致
+        assert not compare(syntaxer, code_raw[:code_raw.rindex('\n', 0, len(code_raw) // 2)])
+
+
+@pytest.mark.parametrize('depth', [1000, 5000])
+def test_deep_nesting(syntaxer, depth):
+    code_raw = 'int main(){ int a; a = %s1%s; %s %s return 0; }' % ('(' * depth, ')' * depth, '{' * depth, '}' * depth)
+    assert compare(syntaxer, code_raw)
+
+
+def test_stale_module_is_not_executed(tmp_path, syntaxer):
+    config_path = str(tmp_path / 'grammar.xml')
+    shutil.copy(CONFIG_PATH, config_path)
+    other = Syntaxer(config_path=config_path, trace=TRACE_OFF)
+    other.load_grammar()
+    path = ParserGenerator.parser_path(other)
+    marker = tmp_path / 'executed'
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('GENERATOR_VERSION = %d\nGRAMMAR_DIGEST = %r\nopen(%r, "w").close()\n'
+                % (ParserGenerator.GENERATOR_VERSION, 'stale', str(marker)))
+    ParserGenerator._loaded.pop(other.grammar_digest, None)
+    parser = ParserGenerator.load_parser(other)
+    assert not marker.exists()
+    assert parser.GRAMMAR_DIGEST == other.grammar_digest
+
+
+def test_concurrent_load(tmp_path):
+    config_path = str(tmp_path / 'grammar.xml')
+    shutil.copy(CONFIG_PATH, config_path)
+    shared = Syntaxer(config_path=config_path, trace=TRACE_OFF)
+    shared.load_grammar()
+    ParserGenerator._loaded.pop(shared.grammar_digest, None)
+    with ThreadPoolExecutor(8) as pool:
+        modules = list(pool.map(lambda _: ParserGenerator.load_parser(shared), range(8)))
+    assert all(module is modules[0] for module in modules)
+    assert [name for name in os.listdir(os.path.dirname(ParserGenerator.parser_path(shared)))
+            if name.endswith('.tmp')] == []
@@ -0,0 +1,54 @@
+"""
+ 分析结果缓存: LRU顺序/按字节数淘汰/过大的项/有效期/命中统计
+"""
+
+import pytest
+import PyCompiler_web_service as web
+from PyCompiler_web_service import ResultCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(web.time, 'time', lambda: now[0])
+    return now
+
+
+def test_lru_eviction_by_bytes(clock):
+    cache = ResultCache(max_bytes=10, ttl=60)
+    cache.put('a', 1, 4)
+    cache.put('b', 2, 4)
+    assert cache.get('a') == 1  # a变为最近使用
+    cache.put('c', 3, 4)  # 超过10字节 淘汰最久未使用的b
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    stats = cache.stats()
+    assert (stats['items'], stats['bytes'], stats['evictions']) == (2, 8, 1)
+    assert (stats['hits'], stats['misses']) == (3, 1)
+
+
+def test_replace_and_oversize(clock):
+    cache = ResultCache(max_bytes=10, ttl=60)
+    cache.put('a', 1, 4)
+    cache.put('a', 2, 6)
+    assert cache.get('a') == 2 and cache.stats()['bytes'] == 6
+    cache.put('big', 3, 11)
+    assert cache.get('big') is None
+    assert cache.stats()['bytes'] == 6 and cache.get('a') == 2
+    cache.put('full', 4, 10)  # 正好等于上限 淘汰其他所有项
+    assert cache.get('a') is None and cache.get('full') == 4
+    assert cache.stats()['evictions'] == 1
+
+
+def test_ttl(clock):
+    cache = ResultCache(max_bytes=10, ttl=5)
+    cache.put('a', 1, 4)
+    clock[0] += 5
+    assert cache.get('a') == 1
+    clock[0] += 0.5  # 读取不延长有效期
+    cache.put('b', 2, 4)
+    clock[0] += 0.1
+    assert cache.get('a') is None
+    assert cache.get('b') == 2
+    stats = cache.stats()
+    assert (stats['expirations'], stats['items'], stats['bytes'], stats['misses']) == (1, 1, 4, 1)